@@ -1,14 +1,28 @@
 import streamlit as st
-import fitz  # PyMuPDF
-import openai
-import base64
-import requests
 import re
-from datetime import datetime
+import time
+import uuid
+
+from figuremate.cache import default_response_cache, file_digest, replaying
+from figuremate.context import has_text
+from figuremate.export import compile_preview, export_file
+from figuremate.jobs import default_manager
+from figuremate.report import (
+    build_context, plan_refinement, refine_report, refine_report_sections, refine_report_stream,
+    run_report_pipeline, strip_code_fences,
+)
+from figuremate.llm import DEFAULT_OUTPUT_TOKENS, skip_response_cache
+from figuremate.sections import TAG_PAT, report_segments
+from figuremate.theme import page_style
+from figuremate.trace import Trace, cost, use_trace
+# PyMuPDF (figuremate.ingest, figuremate.assets), openai and requests are imported on first use:
+# the landing page needs none of them, and they dominate a cold start.
 
 # ============================================================
 # 1. PAGE CONFIG & PREMIUM CSS
 # ============================================================
+
+# Styles and fonts are local static assets (static/, see figuremate.theme).
 st.set_page_config(
     page_title="FigureMate AI - Pro",
     page_icon="🧠",
@@ -16,336 +30,37 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-st.markdown("""
-<style>
-    @import url('https://fonts.googleapis.com/css2?family=Inter:wght@400;500;600;700&display=swap');
-    @import url('https://cdn.jsdelivr.net/gh/orioncactus/pretendard/dist/web/static/pretendard.css');
-
-    html, body, [class*="css"] {
-        font-family: 'Pretendard', 'Inter', -apple-system, system-ui, sans-serif !important;
-    }
-    .stMarkdown p, .stMarkdown li {
-        font-size: 1.1rem !important;
-        line-height: 1.75 !important;
-        color: #334155 !important;
-        margin-bottom: 1.2rem !important;
-    }
-    h1, h2, h3, h4 {
-        color: #0f172a !important;
-        font-weight: 700 !important;
-        letter-spacing: -0.025em !important;
-        margin-top: 1.5rem !important;
-        margin-bottom: 1rem !important;
-    }
-    #MainMenu {visibility: hidden;}
-    footer {visibility: hidden;}
-    header {visibility: hidden;}
-
-    /* Sidebar Density */
-    section[data-testid="stSidebar"] {
-        background-color: #f8fafc;
-        border-right: 1px solid #e2e8f0;
-    }
-    section[data-testid="stSidebar"] .block-container {
-        padding-top: 2rem !important;
-        padding-bottom: 1rem !important;
-        padding-left: 1.5rem !important;
-        padding-right: 1.5rem !important;
-    }
-    section[data-testid="stSidebar"] [data-testid="stVerticalBlock"] > div {
-        gap: 0.5rem !important;
-    }
-
-    /* CTA Button */
-    .stButton > button {
-        background: linear-gradient(135deg, #2563eb 0%, #1d4ed8 100%);
-        color: white;
-        border: none;
-        border-radius: 8px;
-        padding: 0.6rem 1.2rem;
-        font-weight: 600;
-        font-size: 0.95rem;
-        box-shadow: 0 4px 6px -1px rgba(37, 99, 235, 0.2);
-        transition: all 0.3s ease;
-        width: 100%;
-    }
-    .stButton > button:hover {
-        transform: translateY(-1px);
-        box-shadow: 0 8px 12px -3px rgba(37, 99, 235, 0.3);
-    }
-    .stButton > button:disabled {
-        background: #cbd5e1;
-        cursor: not-allowed;
-        transform: none;
-        box-shadow: none;
-    }
-
-    /* Chat Input - Red Border */
-    .stChatInputContainer { padding-bottom: 2rem !important; }
-    .stChatInput {
-        border-radius: 12px !important;
-        border: 2px solid #ff4b4b !important;
-        transition: box-shadow 0.2s;
-    }
-    .stChatInput:focus-within {
-        border-color: #ff4b4b !important;
-        box-shadow: 0 0 0 3px rgba(255, 75, 75, 0.1);
-    }
-    .chat-guide {
-        background-color: #fff1f2;
-        border: 1px solid #fecdd3;
-        border-radius: 8px;
-        padding: 0.75rem 1rem;
-        color: #9f1239;
-        font-size: 0.95rem;
-        margin-bottom: 0.5rem;
-        display: flex;
-        align-items: center;
-        gap: 0.5rem;
-    }
-    .refine-history {
-        background-color: #f0fdf4;
-        border: 1px solid #bbf7d0;
-        border-radius: 8px;
-        padding: 0.6rem 1rem;
-        color: #166534;
-        font-size: 0.85rem;
-        margin-bottom: 0.5rem;
-    }
-</style>
-""", unsafe_allow_html=True)
+st.markdown(page_style(), unsafe_allow_html=True)
 
 
 # ============================================================
 # 2. UTILITY FUNCTIONS
 # ============================================================
 
-def bytes_to_base64(data, ext="png"):
-    encoded = base64.b64encode(data).decode("utf-8")
-    return f"data:image/{ext.replace('.', '')};base64,{encoded}"
-
-
-def build_asset_list(figures):
-    """Builds a text description of available figures for LLM prompts."""
-    if not figures:
-        return "AVAILABLE FIGURES:\n(No figures available)"
-    lines = ["AVAILABLE FIGURES:"]
-    for fid, data in figures.items():
-        lines.append(f"- [[{fid}]]: {data['caption'][:100]}... (Source: {data['source']})")
-    return "\n".join(lines)
+JOB_POLL_SECONDS = 1            # how often the UI polls a running generation job
+MAX_FILES = 5
+MAX_FILES_MAP_REDUCE = 20
 
 
 # ============================================================
 # 3. PDF INGESTION ENGINE
 # ============================================================
 
-def extract_text_and_figures(files):
-    """Parses up to 5 PDFs. Limits 15k chars/doc. Filters images >100px."""
-    merged_text = []
-    figure_registry = {}
-    global_img_count = 1
-
-    for uploaded_file in files:
-        try:
-            uploaded_file.seek(0)
-            doc = fitz.open(stream=uploaded_file.read(), filetype="pdf")
-
-            # Text extraction (truncated)
-            chunks = [f"--- Document: {uploaded_file.name} ---"]
-            total_chars = 0
-            for page in doc:
-                text = page.get_text()
-                if total_chars + len(text) > 15000:
-                    chunks.append(text[:15000 - total_chars] + "\n...(Truncated)...")
-                    break
-                chunks.append(text)
-                total_chars += len(text)
-            merged_text.append("\n".join(chunks))
-
-            # Figure extraction
-            caption_pat = re.compile(r"^(Figure|Fig)(\.|)\s*\d+", re.IGNORECASE)
-            for page_num, page in enumerate(doc):
-                blocks = page.get_text("blocks")
-                for block in blocks:
-                    text = block[4].strip()
-                    if not caption_pat.match(text):
-                        continue
-                    caption_rect = fitz.Rect(block[:4])
-                    pr = page.rect
-                    roi = fitz.Rect(pr.x0 + 30, max(0, caption_rect.y0 - 450), pr.x1 - 30, caption_rect.y0)
-                    try:
-                        pix = page.get_pixmap(clip=roi, dpi=150)
-                        if pix.width > 100 and pix.height > 100:
-                            img_id = f"IMG_{global_img_count:02d}"
-                            png_bytes = pix.tobytes("png")
-                            figure_registry[img_id] = {
-                                "id": img_id,
-                                "source": uploaded_file.name,
-                                "page": page_num + 1,
-                                "caption": text,
-                                "bytes": png_bytes,
-                                "b64": bytes_to_base64(png_bytes),
-                                "ext": "png"
-                            }
-                            global_img_count += 1
-                    except Exception:
-                        pass
-        except Exception:
-            continue
-
-    full_text = "\n\n".join(merged_text)
-    return full_text, figure_registry, len(full_text) // 4
+# Lives in figuremate.ingest so worker processes can import it without Streamlit.
 
 
 # ============================================================
 # 4. AI ORCHESTRATION (Generation + Refinement)
 # ============================================================
 
-def generate_report(api_key, text, figures, model="gpt-4o"):
-    """First-pass report generation with structured prompt."""
-    client = openai.OpenAI(api_key=api_key)
-    asset_list = build_asset_list(figures)
-
-    system_prompt = f"""
-You are an Expert Technical Analyst.
-
-{asset_list}
-
-[Instruction]
-Synthesize the provided documents into ONE cohesive, definitive professional technical report.
-Do NOT just list summaries. Weave a compelling narrative.
-
-[Structure - STRICTLY FOLLOW]
-
-# [Compelling Main Title]
-
-## 1. Introduction
-(Context, Problem Statement, and Background)
-
-## 2. Core Architecture & Methodology
-(Explain the 'How'. *CRITICAL: Insert [[IMG_XX]] tags here naturally to illustrate concepts.*)
-
-## 3. Deep Dive Analysis
-(Performance, nuances, comparisons, and results.)
-
-## 4. Conclusion & Verdict
-(Final thoughts, future outlook, and takeaways.)
-
-## 5. References
-(List the source documents used in the analysis.)
-
-[Formatting Rules]
-- Use clear headings (##).
-- Use bullet points (-) for listing features.
-- Use bold type (**) for emphasis.
-- Output format: [REPORT_MARKDOWN] ||| [DALL-E PROMPT]
-"""
-    try:
-        resp = client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": text[:100000]}
-            ],
-            temperature=0.4
-        )
-        return resp.choices[0].message.content
-    except Exception as e:
-        return f"Error: {e}"
-
-
-def refine_report(api_key, original_text, instruction, figures, history=None, model="gpt-4o"):
-    """Context-aware refinement with figure registry re-injection and history context."""
-    client = openai.OpenAI(api_key=api_key)
-    asset_list = build_asset_list(figures)
-    
-    history_text = ""
-    if history:
-        history_text = "[Previous Edit History]\n" + "\n".join([f"- {h}" for h in history]) + "\n"
-
-    system_prompt = f"""
-You are a meticulous Senior Technical Editor.
-Rewrite the [Original Report] below according to the [User Edit Request].
-
-{asset_list}
-
-{history_text}
-[CRITICAL RULES]
-1. Output the COMPLETE rewritten report from beginning to end. Never output only the changed section.
-2. User instructions (and past history) ALWAYS OVERRIDE default formats. Maintain the language, tone, and structural format established in the [Original Report] unless requested otherwise. Do NOT force a default structure if the user asked for a custom format (e.g., brief summary, table, specific sections).
-3. PRESERVE all existing [[IMG_XX]] tags. Keep them in context or move them to a better position. NEVER delete them.
-4. Do NOT include conversational filler like "Sure, here's the revised version". Output ONLY raw Markdown.
-"""
-    try:
-        resp = client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": f"[Original Report]\n{original_text}\n\n[User Edit Request]\n{instruction}"}
-            ],
-            temperature=0.3
-        )
-        content = resp.choices[0].message.content.strip()
-        # Strip accidental code fences
-        if content.startswith("```"):
-            content = re.sub(r"^```(?:markdown)?\n?", "", content)
-            content = re.sub(r"\n?```$", "", content)
-        return content.strip()
-    except Exception as e:
-        return f"Error: {e}"
-
-
-def generate_hero_image(api_key, prompt_text):
-    """Generates a DALL-E 3 hero image."""
-    client = openai.OpenAI(api_key=api_key)
-    try:
-        resp = client.images.generate(
-            model="dall-e-3", prompt=prompt_text[:4000],
-            size="1024x1024", quality="standard", n=1
-        )
-        return resp.data[0].url
-    except Exception:
-        return None
+# Lives in figuremate.report so the batch CLI can run the same pipeline without Streamlit.
 
 
 # ============================================================
 # 5. MARKDOWN EXPORT COMPILER
 # ============================================================
 
-def compile_markdown_export(blog_text, hero_b64, figure_registry):
-    """Returns (preview_md, download_md) to prevent browser crash."""
-    lines = []
-    date_str = datetime.now().strftime("%Y-%m-%d")
-    lines.append(f"# Technical Analysis Report\n**Date:** {date_str} | **By:** FigureMate AI\n\n---\n")
-
-    if hero_b64:
-        lines.append("![Hero Concept][HERO_IMG]\n\n")
-
-    # Replace [[IMG_XX]] with reference-link syntax
-    tag_pat = re.compile(r"\[\[?(IMG_\d+)\]?\]", re.IGNORECASE)
-
-    def _replacer(m):
-        img_id = m.group(1).upper()
-        if img_id in figure_registry:
-            d = figure_registry[img_id]
-            cap = d['caption'].replace("[", "(").replace("]", ")")
-            return f"\n\n![{cap}][{img_id}]\n*{cap} (Source: {d['source']})*\n\n"
-        return ""
-
-    lines.append(tag_pat.sub(_replacer, blog_text))
-    lines.append("\n\n---\n### Asset References\n")
-
-    body = "\n".join(lines)
-
-    preview_md = body + "\n\n(Image data omitted for preview. Download full file below.)"
-
-    download_md = body
-    if hero_b64:
-        download_md += f"\n[HERO_IMG]: {hero_b64}"
-    for img_id, data in figure_registry.items():
-        download_md += f"\n[{img_id}]: {data['b64']}"
-
-    return preview_md, download_md
+# Lives in figuremate.export: built lazily at download time, never held in session state.
 
 
 # ============================================================
@@ -357,12 +72,43 @@ def init_session_state():
     defaults = {
         "final_result": None,
         "refine_history": [],     # List of past refinement requests
+        "refine_stats": [],       # per request: prompt tokens of its figure list/history and tokens saved
+        "pending_hero": None,     # Hero future that missed the "Assembling" stage
+        "active_job": None,       # ID of the background generation job being watched
+        "job_owner": uuid.uuid4().hex,  # fair-queueing identity of this session
+        "job_error": None,        # failure message of the last job, shown once
+        "trace": Trace(),         # wall time per stage and token usage of this session
+        "ingest_state": {},       # parsed documents and their ID namespaces, reused across uploads
+        "upload_digests": {},     # file_id -> SHA-256 of the current uploads
     }
     for key, val in defaults.items():
         if key not in st.session_state:
             st.session_state[key] = val
 
 
+def attach_pending_hero():
+    """Attaches a hero image that finished after the report was assembled."""
+    future = st.session_state.pending_hero
+    if future is None or not future.done():
+        return
+    st.session_state.pending_hero = None
+    hero_url, hero_b64 = future.result()
+    res = st.session_state.final_result
+    if res and hero_url:
+        res['hero_url'] = hero_url
+        res['hero_b64'] = hero_b64
+        res['preview_md'] = compile_preview(res['blog'], bool(hero_b64), res['figures'])
+
+
+def adopt_job_result(result):
+    """Turns a finished job's result into this session's report."""
+    result = dict(result)  # the job keeps its copy for other reattaching sessions
+    st.session_state.pending_hero = result.pop("pending_hero", None)
+    st.session_state.final_result = result
+    st.session_state.refine_history = []
+    st.session_state.refine_stats = []
+
+
 # ============================================================
 # 7. UI COMPONENTS (Modularized)
 # ============================================================
@@ -379,7 +125,22 @@ def render_sidebar():
         with col_s2:
             if st.button("Clear", use_container_width=True):
                 st.session_state.clear()
+                st.query_params.clear()
                 st.rerun()
+        st.toggle("Live streaming", value=True, key="stream_mode", help="Render the report while it is being written.")
+        map_reduce = st.toggle(
+            "Map-reduce synthesis", value=False, key="map_reduce",
+            help="Summarize every document in full (in parallel), then write the report from the summaries."
+        )
+        st.toggle("Section-level edits", value=True, key="patch_refine",
+                  help="Rewrite only the sections a chat instruction targets instead of the whole report.")
+        if default_response_cache() is not None and not replaying():
+            st.toggle("Reuse cached responses", value=True, key="reuse_responses",
+                      help="Serve identical requests from the response cache. Turn off to fetch (and re-record) fresh ones.")
+        if st.toggle("Usage & timings", value=False, key="show_trace",
+                     help="Actual tokens, cost and wall time per stage for this session."):
+            render_trace_panel(st.session_state.trace)
+        max_files = MAX_FILES_MAP_REDUCE if map_reduce else MAX_FILES
 
         st.markdown("---")
         st.markdown("**📂 Upload PDFs**")
@@ -389,45 +150,86 @@ def render_sidebar():
         figure_data = {}
 
         if uploaded_files:
-            if len(uploaded_files) > 5:
-                st.error("Max 5 files.")
+            if len(uploaded_files) > max_files:
+                st.error(f"Max {max_files} files.")
             else:
-                names = [f.name for f in uploaded_files]
+                # Keyed by upload (file_id), not just name: same-named different files must re-parse
+                names = [(f.name, f.file_id) for f in uploaded_files]
                 if st.session_state.get('last_uploaded') != names:
+                    from figuremate.ingest import extract_text_and_figures
                     with st.spinner("Analyzing..."):
-                        extracted_data, figure_data, tokens = extract_text_and_figures(uploaded_files)
-                        st.session_state['extracted_data'] = extracted_data
+                        # Each upload is hashed once, not on every rerun
+                        known = st.session_state.upload_digests
+                        digests = {f.file_id: known.get(f.file_id) or file_digest(f) for f in uploaded_files}
+                        st.session_state.upload_digests = digests
+                        # Incremental: unchanged files are reused and keep their IMG_<doc>_<nn> IDs
+                        full_text, figure_data, _ = extract_text_and_figures(
+                            uploaded_files, max_doc_chars=None, state=st.session_state.ingest_state,
+                            digests=[digests[f.file_id] for f in uploaded_files])
+                        st.session_state['full_text'] = full_text
                         st.session_state['figure_data'] = figure_data
-                        st.session_state['total_tokens'] = tokens
                         st.session_state['last_uploaded'] = names
-                else:
-                    extracted_data = st.session_state.get('extracted_data')
-                    figure_data = st.session_state.get('figure_data')
-
-                if 'total_tokens' in st.session_state:
+                        if st.session_state.final_result:
+                            # Existing tags stay valid; figures of added files become available to edits
+                            st.session_state.final_result['figures'] = {
+                                **st.session_state.final_result['figures'], **figure_data}
+                figure_data = st.session_state.get('figure_data')
+
+                # Model input: full text for map-reduce, else relevance-ranked chunks packed into the model's budget
+                context_key = (names, model, map_reduce)
+                if st.session_state.get('context_key') != context_key:
+                    context, tokens = build_context(st.session_state['full_text'], figure_data, model, map_reduce)
+                    st.session_state['extracted_data'] = context
+                    st.session_state['total_tokens'] = tokens
+                    st.session_state['context_key'] = context_key
+                extracted_data = st.session_state.get('extracted_data')
+
+                if not has_text(extracted_data):
+                    st.warning("No extractable text in these PDFs (scanned pages need OCR first).")
+                elif 'total_tokens' in st.session_state:
                     c1, c2 = st.columns(2)
-                    c1.caption(f"**Size**: {st.session_state['total_tokens'] // 1000}k Tok")
-                    c2.caption(f"**Est**: ${(st.session_state['total_tokens'] / 1000) * 0.005:.3f}")
+                    c1.caption(f"**Size**: {st.session_state['total_tokens'] / 1000:.1f}k Tok")
+                    c2.caption(f"**Est**: ${cost(model, st.session_state['total_tokens'], DEFAULT_OUTPUT_TOKENS):.3f}")
 
                 if figure_data:
                     st.success(f"{len(figure_data)} Figures extracted")
                     with st.expander("View Assets"):
                         for fid, d in figure_data.items():
-                            st.image(d['bytes'], caption=f"[{fid}]", use_container_width=True)
+                            st.image(d['thumb'], caption=f"[{fid}]", use_container_width=True)
         else:
-            st.caption("Upload up to 5 PDFs to begin.")
+            st.caption(f"Upload up to {max_files} PDFs to begin.")
 
         st.markdown("---")
 
         api_ready = api_key and api_key.startswith("sk-")
-        data_ready = extracted_data is not None
-        generate_btn = st.button("🚀 GENERATE REPORT", disabled=not (api_ready and data_ready), use_container_width=True, type="primary")
+        data_ready = has_text(extracted_data)
+        busy = st.session_state.get("active_job") is not None
+        generate_btn = st.button("🚀 GENERATE REPORT", disabled=busy or not (api_ready and data_ready), use_container_width=True, type="primary")
 
         st.markdown("<div style='text-align:center; color:#94a3b8; font-size:0.8rem; margin-top:2rem;'>Powered by FigureMate AI</div>", unsafe_allow_html=True)
 
     return api_key, model, extracted_data, figure_data, generate_btn
 
 
+def render_trace_panel(trace):
+    """Sidebar panel: real token usage and cost per model, wall time per stage."""
+    usage = trace.usage()
+    calls = sum(u['calls'] for u in usage.values())
+    st.caption(f"**Spent**: ${trace.total_cost():.4f} ({calls} API calls)")
+    if usage:
+        st.dataframe([
+            {"model": m, "calls": u['calls'], "prompt": u['prompt_tokens'], "completion": u['completion_tokens'],
+             "images": u['images'], "cost $": round(u['cost'], 4)}
+            for m, u in usage.items()
+        ], hide_index=True, use_container_width=True)
+    stages = trace.stages()
+    if stages:
+        st.dataframe([
+            {"stage": name, "n": s['count'], "total s": round(s['total_s'], 2), "max s": round(s['max_s'], 2)}
+            for name, s in stages.items()
+        ], hide_index=True, use_container_width=True)
+
+
 def render_empty_state():
     """Renders the landing page when no report has been generated."""
     st.markdown("""
@@ -439,34 +241,154 @@ def render_empty_state():
     """, unsafe_allow_html=True)
 
 
+@st.cache_resource(max_entries=512, show_spinner=False)
+def _display_image(digest, _data, ext):
+    """Figure bytes as st.image serves them, prepared once per figure digest (not per rerun)."""
+    from figuremate.assets import display_image
+    return display_image(_data, ext)
+
+
+def render_figure(img_id, data):
+    """Renders one report figure centered between spacer columns."""
+    image, fmt = _display_image(data['digest'], data['bytes'], data['ext'])
+    st.markdown("<br>", unsafe_allow_html=True)
+    _, col_img, _ = st.columns([1, 8, 1])
+    with col_img:
+        st.image(image, output_format=fmt, caption=f"Figure {img_id}: {data['caption']} (Source: {data['source']})", use_container_width=True)
+    st.markdown("<br>", unsafe_allow_html=True)
+
+
+# A complete figure tag, or a newline that starts a heading (= previous section done)
+STREAM_BREAK_PAT = re.compile(TAG_PAT.pattern + r"|\n(?=#{1,6} )", re.IGNORECASE)
+# Trailing text that may still grow into a figure tag or the ||| delimiter
+STREAM_PARTIAL_PAT = re.compile(r"(\[\[?(I(M(G(_\d*(_\d*)?)?)?)?)?|\|{1,2})$", re.IGNORECASE)
+
+
+def render_report_stream(deltas, figures, target):
+    """Renders a report into `target` while it streams in. Returns the raw text.
+
+    Completed pieces (text up to a finished [[IMG_XX]] tag or the next heading,
+    then the tag's figure) are rendered once; only the trailing in-progress
+    piece is repainted, throttled, and with any half-received tag or delimiter
+    hidden. Text after the `|||` DALL-E prompt delimiter is never shown.
+    """
+    raw = ""
+    pending = ""
+    in_prompt = False
+    live = None
+    last_paint = 0.0
+
+    def paint(text):
+        nonlocal live
+        if live is None:
+            live = st.empty()
+        if text.strip():
+            live.markdown(text, unsafe_allow_html=True)
+
+    def commit(done):
+        nonlocal pending, live
+        while True:
+            m = STREAM_BREAK_PAT.search(pending)
+            # a tag ending the buffer may still be "[[IMG_1_01]" awaiting its last "]"
+            if not m or (not done and m.group(1) and m.end() == len(pending)):
+                return
+            paint(pending[:m.start()])
+            live = None
+            if m.group(1) and m.group(1).upper() in figures:
+                render_figure(m.group(1).upper(), figures[m.group(1).upper()])
+            pending = pending[m.end():]
+
+    with target.container():
+        for delta in deltas:
+            raw += delta
+            if in_prompt:
+                continue
+            pending += delta
+            if "|||" in pending:
+                pending = pending.split("|||", 1)[0]
+                in_prompt = True
+            commit(done=False)
+            if time.monotonic() - last_paint > 0.1:
+                paint(STREAM_PARTIAL_PAT.sub("", pending))
+                last_paint = time.monotonic()
+        commit(done=True)
+        paint(pending)
+    return raw
+
+
+STAGE_LABELS = {
+    "Summarizing": "🗂️ **Summarizing** — 문서별 요약 병렬 생성 중...",
+    "Drafting": "📝 **Drafting** — 문서 분석 및 보고서 작성 중...",
+    "Visualizing": "🎨 **Visualizing** — DALL-E 3 Hero Image 생성 중...",
+    "Assembling": "💾 **Assembling** — 최종 보고서 조립 중...",
+}
+
+
+def render_draft(draft, figures):
+    """Renders a partially written report: any half-received tag and the
+    text after a `|||` DALL-E prompt delimiter are hidden."""
+    text = STREAM_PARTIAL_PAT.sub("", draft.split("|||", 1)[0])
+    for kind, value in report_segments(text):
+        if kind == "figure":
+            if value in figures:
+                render_figure(value, figures[value])
+        else:
+            st.markdown(value, unsafe_allow_html=True)
+
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def render_job_progress():
+    """Polls the active background job; reruns the whole app once it has finished."""
+    manager = default_manager()
+    job = manager.get(st.session_state.active_job)
+    if job is None:
+        st.session_state.active_job = None
+        st.query_params.pop("job", None)
+        st.warning("This generation job is no longer available. Please generate again.")
+        return
+
+    snap = job.snapshot()
+    if snap["status"] not in ("queued", "running"):
+        st.session_state.active_job = None
+        if snap["status"] == "done" and isinstance(snap["result"], dict):
+            adopt_job_result(snap["result"])
+        else:
+            # "Error: ..." returned by the pipeline, an exception, or a cancel
+            st.session_state.job_error = snap["result"] or snap["error"] or "Cancelled."
+            st.query_params.pop("job", None)
+        st.rerun()
+
+    if snap["status"] == "queued":
+        label = f"⏳ 대기 중... (queue position {manager.position(job)})"
+    else:
+        label = "🧠 전문적인 분석 문서 생성 중..."
+    with st.status(label, expanded=True):
+        for stage in snap["stages"]:
+            st.write(STAGE_LABELS.get(stage, stage))
+        if st.button("Cancel", key="cancel_job"):
+            manager.cancel(job.id)
+    if snap["draft"]:
+        render_draft(snap["draft"], job.context.get("figures", {}))
+
+
 def render_report_content(res):
     """Renders the generated report with interleaved images."""
     # Hero Image
     if res.get('hero_url'):
         st.image(res['hero_url'], use_container_width=True)
         st.caption("AI-Generated Conceptual Visualization")
+    elif st.session_state.get('pending_hero'):
+        st.caption("🎨 Hero image is still rendering — it will appear on the next interaction.")
 
     st.markdown("---")
 
-    # Interleaved text + images
-    content = res['blog']
-    pattern = re.compile(r"(\[\[?IMG_\d+\]?\])", re.IGNORECASE)
-    parts = pattern.split(content)
-
-    for part in parts:
-        tag_match = re.match(r"\[\[?(IMG_\d+)\]?\]", part, re.IGNORECASE)
-        if tag_match:
-            img_id = tag_match.group(1).upper()
-            if img_id in res['figures']:
-                data = res['figures'][img_id]
-                st.markdown("<br>", unsafe_allow_html=True)
-                _, col_img, _ = st.columns([1, 8, 1])
-                with col_img:
-                    st.image(data['bytes'], caption=f"Figure {img_id}: {data['caption']} (Source: {data['source']})", use_container_width=True)
-                st.markdown("<br>", unsafe_allow_html=True)
+    # Interleaved text + images (segments are memoized per report text)
+    for kind, value in report_segments(res['blog']):
+        if kind == "figure":
+            if value in res['figures']:
+                render_figure(value, res['figures'][value])
         else:
-            if part.strip():
-                st.markdown(part, unsafe_allow_html=True)
+            st.markdown(value, unsafe_allow_html=True)
 
     st.markdown("---")
 
@@ -475,8 +397,10 @@ def render_refine_section(api_key, model):
     """Renders the interactive refinement chat and history."""
     # Show refinement history
     if st.session_state.refine_history:
+        stats = st.session_state.refine_stats
         for i, entry in enumerate(st.session_state.refine_history):
-            st.markdown(f'<div class="refine-history">✅ <strong>이전 수정 #{i+1}:</strong> {entry}</div>', unsafe_allow_html=True)
+            saved = f" <small>(prompt −{stats[i]['saved_tokens']:,} tokens)</small>" if i < len(stats) and stats[i] else ""
+            st.markdown(f'<div class="refine-history">✅ <strong>이전 수정 #{i+1}:</strong> {entry}{saved}</div>', unsafe_allow_html=True)
 
     # Guide box
     st.markdown("""
@@ -497,43 +421,96 @@ def render_refine_section(api_key, model):
             st.write(user_instruction)
 
         with st.chat_message("assistant"):
-            with st.spinner("Refining content..."):
-                res = st.session_state.final_result
-                new_blog = refine_report(
-                    api_key,
-                    res['blog'],
-                    user_instruction,
-                    res['figures'],
-                    st.session_state.refine_history,
-                    model
-                )
-
-                if "Error:" not in new_blog:
-                    preview_md, download_md = compile_markdown_export(new_blog, res['hero_b64'], res['figures'])
-                    st.session_state.final_result['blog'] = new_blog
-                    st.session_state.final_result['preview_md'] = preview_md
-                    st.session_state.final_result['download_md'] = download_md
-                    st.session_state.refine_history.append(user_instruction)
-                    st.rerun()
-                else:
-                    st.error(f"Update failed: {new_blog}")
+            res = st.session_state.final_result
+            new_blog = None
+            first_record = len(st.session_state.trace.records)
+            if st.session_state.get("patch_refine", True):
+                with st.spinner("Refining targeted sections..."):
+                    targets = plan_refinement(api_key, res['blog'], user_instruction)
+                    if targets:
+                        new_blog = refine_report_sections(
+                            api_key,
+                            res['blog'],
+                            targets,
+                            user_instruction,
+                            res['figures'],
+                            st.session_state.refine_history,
+                            model
+                        )
+                        if new_blog.startswith("Error:"):
+                            new_blog = None  # fall back to a full rewrite
+
+            if new_blog is None and st.session_state.get("stream_mode", True):
+                try:
+                    deltas = refine_report_stream(
+                        api_key,
+                        res['blog'],
+                        user_instruction,
+                        res['figures'],
+                        st.session_state.refine_history,
+                        model
+                    )
+                    new_blog = strip_code_fences(render_report_stream(deltas, res['figures'], st.empty()))
+                except Exception as e:
+                    new_blog = f"Error: {e}"
+            elif new_blog is None:
+                with st.spinner("Refining content..."):
+                    new_blog = refine_report(
+                        api_key,
+                        res['blog'],
+                        user_instruction,
+                        res['figures'],
+                        st.session_state.refine_history,
+                        model
+                    )
+
+            if not new_blog.startswith("Error:"):
+                st.session_state.final_result['blog'] = new_blog
+                st.session_state.final_result['preview_md'] = compile_preview(new_blog, bool(res['hero_b64']), res['figures'])
+                st.session_state.refine_history.append(user_instruction)
+                # The prompt that produced the accepted report is the last one built this turn
+                contexts = [r for r in st.session_state.trace.records[first_record:] if r.get("stage") == "refine.context"]
+                st.session_state.refine_stats.append(
+                    {"tokens": contexts[-1]["tokens"], "saved_tokens": contexts[-1]["saved_tokens"]} if contexts else None)
+                st.rerun()
+            else:
+                st.error(f"Update failed: {new_blog}")
 
 
 def render_export_section(res):
     """Renders the copy and download buttons."""
-    with st.expander("📋 One-Click Copy"):
-        st.code(res['preview_md'], language="markdown")
+    # Lazy: the (large) preview is only sent while the expander is open
+    copy_box = st.expander("📋 One-Click Copy", key="copy_open", on_change="rerun")
+    if copy_box.open:
+        with copy_box:
+            st.code(res['preview_md'], language="markdown")
 
-    col_dl, _ = st.columns([1, 2])
+    # Exports are generated only when a button is clicked (deferred callables)
+    blog, hero_b64, figures = res['blog'], res['hero_b64'], res['figures']
+    session_trace = st.session_state.trace
+
+    def build(kind):
+        with use_trace(session_trace):
+            return export_file(kind, blog, hero_b64, figures)
+
+    col_dl, col_zip, _ = st.columns([1, 1, 1])
     with col_dl:
         st.download_button(
             label="📥 Download Markdown Report",
-            data=res['download_md'],
+            data=lambda: build("md"),
             file_name="FigureMate_Report.md",
             mime="text/markdown",
             use_container_width=True,
             type="primary"
         )
+    with col_zip:
+        st.download_button(
+            label="🗂️ Download ZIP Bundle",
+            data=lambda: build("zip"),
+            file_name="FigureMate_Report.zip",
+            mime="application/zip",
+            use_container_width=True
+        )
 
 
 # ============================================================
@@ -542,48 +519,43 @@ def render_export_section(res):
 
 def main():
     init_session_state()
+    # Spans and token usage of everything this run does (and of jobs it submits) go to the session trace
+    with use_trace(st.session_state.trace), skip_response_cache(not st.session_state.get("reuse_responses", True)):
+        render_page()
 
+
+def render_page():
     # Sidebar (returns controls)
     api_key, model, extracted_data, figure_data, generate_btn = render_sidebar()
 
-    # Generation Pipeline
+    # Generation runs as a background job; this script only submits and polls it
     if generate_btn:
-        with st.status("🧠 전문적인 분석 문서 생성 중...", expanded=True) as status:
-            st.write("📝 **Drafting** — 문서 분석 및 보고서 작성 중...")
-            raw = generate_report(api_key, extracted_data, figure_data, model)
-
-            if "Error:" not in raw:
-                parts = raw.split("|||")
-                blog = parts[0].strip()
-                dalle_prompt = parts[1].strip() if len(parts) > 1 else "Abstract Technology"
-
-                st.write("🎨 **Visualizing** — DALL-E 3 Hero Image 생성 중...")
-                hero_url = generate_hero_image(api_key, dalle_prompt)
-                hero_b64 = None
-                if hero_url:
-                    try:
-                        hero_b64 = bytes_to_base64(requests.get(hero_url).content)
-                    except Exception:
-                        pass
-
-                st.write("💾 **Assembling** — 최종 보고서 조립 중...")
-                preview_md, download_md = compile_markdown_export(blog, hero_b64, figure_data)
-
-                st.session_state.final_result = {
-                    "blog": blog,
-                    "hero_url": hero_url,
-                    "preview_md": preview_md,
-                    "download_md": download_md,
-                    "figures": figure_data,
-                    "hero_b64": hero_b64
-                }
-                st.session_state.refine_history = []
-                status.update(label="✅ Complete!", state="complete", expanded=False)
-            else:
-                st.error(f"Analysis Failed: {raw}")
+        job = default_manager().submit(
+            st.session_state.job_owner, run_report_pipeline, api_key, extracted_data, figure_data, model,
+            map_reduce=st.session_state.get("map_reduce", False),
+            stream=st.session_state.get("stream_mode", True),
+        )
+        if job is None:
+            st.error("Server is busy — too many reports are queued. Please try again shortly.")
+        else:
+            job.context["figures"] = figure_data
+            st.session_state.active_job = job.id
+            st.session_state.job_error = None
+            st.query_params["job"] = job.id  # a reloaded page reattaches through the URL
+            st.rerun()
+    elif not st.session_state.active_job and not st.session_state.final_result and "job" in st.query_params:
+        st.session_state.active_job = st.query_params["job"]
+
+    if st.session_state.active_job:
+        render_job_progress()
+        return
+    if st.session_state.get("job_error"):
+        st.error(f"Analysis Failed: {st.session_state.job_error}")
+        st.session_state.job_error = None
 
     # Rendering
     if st.session_state.final_result:
+        attach_pending_hero()
         res = st.session_state.final_result
         render_report_content(res)
         render_refine_section(api_key, model)
@@ -0,0 +1,72 @@
+"""Eager in-memory Markdown export vs. the streaming export writers.
+
+    python -m benchmarks.bench_export --figures 10 40 160
+
+Peak Python heap is measured with tracemalloc while producing one export.
+The streaming writers go to a file on disk, which is how the batch CLI and
+large downloads use them; the legacy path is the old string-append loop.
+"""
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+from figuremate.export import bytes_to_base64, write_markdown_export, write_zip_export
+
+BLOG = "## 1. Intro\n" + "\n".join(f"Paragraph {i}. [[IMG_{i + 1:02d}]]" for i in range(200))
+
+
+def legacy_export(blog_text, hero_b64, figure_registry):
+    download_md = blog_text
+    if hero_b64:
+        download_md += f"\n[HERO_IMG]: {hero_b64}"
+    for img_id, data in figure_registry.items():
+        download_md += f"\n[{img_id}]: {data['b64']}"
+    return download_md
+
+
+def _registry(n, size):
+    figures = {}
+    for i in range(n):
+        data = os.urandom(size)
+        figures[f"IMG_{i + 1:02d}"] = {"caption": f"Figure {i + 1}", "source": "paper.pdf",
+                                       "bytes": data, "ext": "png", "b64": bytes_to_base64(data)}
+    return figures
+
+
+def _peak(fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--figures", type=int, nargs="+", default=[10, 40, 160])
+    parser.add_argument("--figure-kb", type=int, default=200)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    print(f"{'figures':>7} | {'legacy string':>22} | {'streamed .md':>22} | {'streamed .zip':>22}")
+    for n in args.figures:
+        figures = _registry(n, args.figure_kb * 1024)
+
+        def stream_md():
+            with open(os.path.join(tmp, "r.md"), "w", encoding="utf-8") as f:
+                write_markdown_export(f, BLOG, None, figures)
+
+        def stream_zip():
+            with open(os.path.join(tmp, "r.zip"), "wb") as f:
+                write_zip_export(f, BLOG, None, figures)
+
+        cols = [_peak(lambda: legacy_export(BLOG, None, figures)), _peak(stream_md), _peak(stream_zip)]
+        print(f"{n:>7} | " + " | ".join(f"{t * 1000:7.1f} ms {p / 1e6:8.2f} MB" for t, p in cols))
+
+
+if __name__ == "__main__":
+    main()
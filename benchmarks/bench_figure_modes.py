@@ -0,0 +1,36 @@
+"""ROI re-rasterization vs. embedded-image extraction by xref.
+
+    python -m benchmarks.bench_figure_modes --pages 40 --vector-every 4
+"""
+import argparse
+import time
+
+from benchmarks.synthetic import make_corpus
+from figuremate.ingest import extract_text_and_figures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--docs", type=int, default=3)
+    parser.add_argument("--pages", type=int, default=40)
+    parser.add_argument("--image-size", type=int, default=256)
+    parser.add_argument("--vector-every", type=int, default=4, help="every Nth figure is a vector drawing")
+    args = parser.parse_args()
+
+    files = make_corpus(docs=args.docs, pages=args.pages, image_size=args.image_size, vector_every=args.vector_every)
+    rows = []
+    for mode in ("render", "embedded"):
+        start = time.perf_counter()
+        _, figures, _ = extract_text_and_figures(files, workers=1, cache=False, mode=mode)
+        elapsed = time.perf_counter() - start
+        payload = sum(len(f["bytes"]) for f in figures.values())
+        rows.append((mode, elapsed, len(figures), payload))
+
+    print(f"docs={args.docs} pages={args.pages} image={args.image_size}px vector_every={args.vector_every}")
+    for mode, elapsed, count, payload in rows:
+        print(f"{mode:9s}: {elapsed:7.2f}s  figures={count:4d}  payload={payload / 1e6:7.2f} MB")
+    print(f"speedup  : {rows[0][1] / rows[1][1]:7.2f}x  payload ratio {rows[1][3] / rows[0][3]:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""Fixed 450pt crop vs. layout-aware figure regions for rasterized figures.
+
+    python -m benchmarks.bench_figure_regions --pages 20 --columns 1 2
+
+Every figure is a vector drawing (so all of them are rasterized). For each
+region mode prints the figures found, the pixels rendered, the encoded
+payload and the ingestion time.
+"""
+import argparse
+import time
+
+from benchmarks.synthetic import make_corpus
+from figuremate import ingest, trace
+from figuremate.ingest import extract_text_and_figures
+
+
+def _run(files, mode):
+    ingest.REGION_MODE = mode
+    run = trace.Trace(log=False)
+    start = time.perf_counter()
+    with trace.use_trace(run):
+        _, figures, _ = extract_text_and_figures(files, workers=1, cache=False, mode="render")
+    elapsed = time.perf_counter() - start
+    pixels = sum(r.get("pixels", 0) for r in run.records if r.get("stage") == "ingest.figure")
+    payload = sum(len(f["bytes"]) for f in figures.values())
+    captions = sorted((f["source"], f["caption"]) for f in figures.values())
+    return elapsed, captions, pixels, payload
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=2)
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--captions-per-page", type=int, default=2)
+    parser.add_argument("--columns", type=int, nargs="+", default=[1, 2])
+    args = parser.parse_args()
+
+    for columns in args.columns:
+        files = make_corpus(docs=args.docs, pages=args.pages, captions_per_page=args.captions_per_page,
+                            vector_every=1, columns=columns)
+        rows = {mode: _run(files, mode) for mode in ("fixed", "layout")}
+        print(f"columns={columns} docs={args.docs} pages={args.pages} captions/page/column={args.captions_per_page}")
+        for mode, (elapsed, captions, pixels, payload) in rows.items():
+            print(f"  {mode:7s}: {elapsed:6.2f}s  figures={len(captions):4d}  pixels={pixels / 1e6:8.2f} M"
+                  f"  payload={payload / 1e6:6.2f} MB")
+        fixed, layout = rows["fixed"], rows["layout"]
+        print(f"  pixels {layout[2] / fixed[2]:.2f}x, payload {layout[3] / fixed[3]:.2f}x, time {layout[0] / fixed[0]:.2f}x")
+        if layout[1] != fixed[1]:
+            print(f"  figure sets differ: {len(set(fixed[1]) - set(layout[1]))} only in fixed, "
+                  f"{len(set(layout[1]) - set(fixed[1]))} only in layout")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""Sequential vs. process-pool ingestion.
+
+    python -m benchmarks.bench_ingest_parallel --docs 5 --pages 40 --workers 4 --repeat 3
+
+The parse pool lives as long as the process, so the first parallel call
+also spawns the workers (each re-imports PyMuPDF and Pillow). That call is
+untimed warm-up and reported as the spawn cost; the parallel row is the best
+of `--repeat` calls on the warm pool, as in a long-running server.
+"""
+import argparse
+import os
+import time
+
+from benchmarks.synthetic import make_corpus
+from figuremate import ingest
+from figuremate.ingest import extract_text_and_figures
+
+
+def _timed(files, workers):
+    start = time.perf_counter()
+    result = extract_text_and_figures(files, workers=workers, cache=False)
+    return time.perf_counter() - start, result
+
+
+def _best(files, workers, repeat):
+    runs = [_timed(files, workers) for _ in range(repeat)]
+    return min(t for t, _ in runs), runs[-1][1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=5)
+    parser.add_argument("--pages", type=int, default=40)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    ingest.POOL_MIN_MB = 0  # always use the pool, however small the corpus
+    files = make_corpus(docs=args.docs, pages=args.pages)
+    seq_time, seq = _best(files, 1, args.repeat)
+    first_time, _ = _timed(files, args.workers)  # starts the pool
+    par_time, par = _best(files, args.workers, args.repeat)
+
+    assert seq[0] == par[0], "text order differs"
+    assert [(k, v["source"], v["page"], v["bytes"]) for k, v in seq[1].items()] == \
+        [(k, v["source"], v["page"], v["bytes"]) for k, v in par[1].items()], "figure numbering differs"
+
+    print(f"docs={args.docs} pages={args.pages} figures={len(seq[1])}")
+    print(f"sequential          : {seq_time:7.2f}s")
+    print(f"parallel (workers={args.workers}): {par_time:7.2f}s  (warm pool)")
+    print(f"first parallel call : {first_time:7.2f}s  (pool spawn ~{max(first_time - par_time, 0):.2f}s)")
+    print(f"speedup             : {seq_time / par_time:7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
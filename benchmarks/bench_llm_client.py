@@ -0,0 +1,67 @@
+"""Shared LLM client vs. a new client per call, against the local stub server.
+
+    python -m benchmarks.bench_llm_client --calls 40 --threads 8
+
+Also checks that 429s are retried transparently and that the RPM bucket paces
+a burst.
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import openai
+
+from figuremate.stub import start_stub
+from figuremate import llm
+
+MESSAGES = [{"role": "user", "content": "ping"}]
+
+
+def _run(calls, threads, fn):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        list(pool.map(lambda _: fn(), range(calls)))
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--calls", type=int, default=40)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.02)
+    args = parser.parse_args()
+
+    server, base_url = start_stub(latency=args.latency)
+    llm.configure_rate_limit("gpt-4o", rpm=100_000, tpm=None)
+
+    def fresh():
+        openai.OpenAI(api_key="sk-stub", base_url=base_url, max_retries=0).chat.completions.create(
+            model="gpt-4o", messages=MESSAGES)
+
+    def shared():
+        llm.chat("sk-stub", model="gpt-4o", messages=MESSAGES, base_url=base_url)
+
+    server.state.connections.clear()
+    t_fresh = _run(args.calls, args.threads, fresh)
+    conns_fresh = len(server.state.connections)
+    server.state.connections.clear()
+    t_shared = _run(args.calls, args.threads, shared)
+    conns_shared = len(server.state.connections)
+    print(f"new client per call: {t_fresh:6.2f}s  connections={conns_fresh}")
+    print(f"shared client      : {t_shared:6.2f}s  connections={conns_shared}")
+
+    # 429 handling: the first 3 requests are rejected, the call still succeeds
+    server.state.fail_remaining = 3
+    before = server.state.requests
+    llm.chat("sk-stub", model="gpt-4o", messages=MESSAGES, base_url=base_url)
+    print(f"retry on 429       : ok after {server.state.requests - before} requests")
+
+    # Pacing: 120 RPM -> a burst of 124 calls needs ~2s beyond the bucket's 120
+    llm.configure_rate_limit("gpt-4o", rpm=120, tpm=None)
+    t_paced = _run(124, args.threads, shared)
+    print(f"124 calls @120 RPM : {t_paced:6.2f}s (bucket drained, then ~0.5s per call)")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
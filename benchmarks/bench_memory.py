@@ -0,0 +1,66 @@
+"""Peak memory of ingesting one PDF as its page count grows.
+
+    python -m benchmarks.bench_memory --pages 100 300 900
+
+"legacy" reads the whole file into memory and keeps every figure and all of
+its text (the old behaviour); "bounded" opens the file from disk with the
+default large-document limits (figure cap, text budget). Each run happens in a fresh process and reports its peak RSS
+(Linux only).
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.synthetic import make_pdf
+from figuremate import ingest
+from figuremate.ingest import extract_text_and_figures, parse_document
+
+
+def _child(path, mode):
+    start = time.perf_counter()
+    if mode == "legacy":
+        ingest.LARGE_DOC_CHARS = 0
+        with open(path, "rb") as f:
+            text, figures = parse_document(f.read(), max_chars=None, max_figures=0, max_mb=0)
+    else:
+        text, figures, _ = extract_text_and_figures([path], workers=1, cache=False, max_doc_chars=None)
+    # VmHWM, not ru_maxrss: the latter survives exec and would report the parent's peak
+    with open("/proc/self/status") as f:
+        peak_mb = next(int(line.split()[1]) for line in f if line.startswith("VmHWM:")) / 1024
+    print(f"{peak_mb:.1f} {len(figures)} {time.perf_counter() - start:.2f} {len(text)}")
+
+
+def _measure(path, mode):
+    out = subprocess.run([sys.executable, "-m", "benchmarks.bench_memory", "--child", path, mode],
+                         capture_output=True, text=True, check=True).stdout.splitlines()[-1].split()
+    return float(out[0]), int(out[1]), float(out[2]), int(out[3])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, nargs="+", default=[100, 300, 900])
+    parser.add_argument("--image-size", type=int, default=256)
+    parser.add_argument("--child", nargs=2, metavar=("PATH", "MODE"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        return _child(*args.child)
+
+    print(f"{'pages':>6s} {'file MB':>8s} {'mode':>8s} {'peak MB':>8s} {'figures':>8s} {'time':>7s} {'chars':>9s}")
+    for pages in args.pages:
+        with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as f:
+            f.write(make_pdf(pages=pages, image_size=args.image_size))
+        try:
+            size_mb = os.path.getsize(f.name) / 2**20
+            for mode in ("legacy", "bounded"):
+                peak, figures, seconds, chars = _measure(f.name, mode)
+                print(f"{pages:6d} {size_mb:8.1f} {mode:>8s} {peak:8.1f} {figures:8d} {seconds:6.2f}s {chars:9d}",
+                      flush=True)
+        finally:
+            os.unlink(f.name)
+
+
+if __name__ == "__main__":
+    main()
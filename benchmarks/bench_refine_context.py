@@ -0,0 +1,62 @@
+"""Refinement prompt size over a long editing session.
+
+    python -m benchmarks.bench_refine_context --figures 60 --used 10 --turns 20
+
+Runs `--turns` refine_report calls against the stub server on a report that
+tags `--used` of `--figures` figures, with the edit history growing each turn.
+Prints the prompt tokens per turn as the stub bills them, and the tokens the
+compact figure list and history saved against the full forms.
+"""
+import argparse
+import os
+
+from benchmarks.bench_rerun import make_report
+from figuremate import llm, trace
+from figuremate.report import refine_report
+from figuremate.stub import start_stub
+
+INSTRUCTION = "Make section {n} more concise and add one concrete number from the results to its first paragraph."
+
+
+def make_figures(count, docs=3):
+    return {
+        f"IMG_{i % docs + 1}_{i // docs + 1:02d}": {
+            "caption": f"Figure {i + 1}. Latency and throughput of configuration {i + 1} across batch sizes "
+                       f"and sequence lengths on the evaluation hardware.",
+            "source": f"paper_{i % docs + 1}.pdf",
+        }
+        for i in range(count)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--figures", type=int, default=60)
+    parser.add_argument("--used", type=int, default=10)
+    parser.add_argument("--turns", type=int, default=20)
+    args = parser.parse_args()
+
+    figures = make_figures(args.figures)
+    report = make_report(list(figures)[:args.used])
+    server, base_url = start_stub()
+    os.environ["OPENAI_BASE_URL"] = base_url
+    llm.configure_rate_limit("gpt-4o", 1_000_000)
+
+    history = []
+    print(f"{'turn':>4s} {'prompt tokens':>14s} {'saved':>7s} {'without':>8s}")
+    try:
+        for turn in range(1, args.turns + 1):
+            instruction = INSTRUCTION.format(n=turn)
+            run = trace.Trace(log=False)
+            with trace.use_trace(run):
+                refine_report("sk-bench", report, instruction, figures, history)
+            prompt = run.usage()["gpt-4o"]["prompt_tokens"]
+            saved = next(r["saved_tokens"] for r in run.records if r.get("stage") == "refine.context")
+            print(f"{turn:4d} {prompt:14d} {saved:7d} {prompt + saved:8d}")
+            history.append(instruction)
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Streamlit rerun latency with a finished report on screen.
+
+    python -m benchmarks.bench_rerun --figures 40 --reruns 10
+
+Drives app.py headlessly with AppTest: a synthetic report with N figure tags
+is placed in session state and the script is rerun, which is what every
+sidebar click or chat submission costs before any new work starts.
+"""
+import argparse
+import os
+import statistics
+import time
+
+from streamlit.testing.v1 import AppTest
+
+from benchmarks.synthetic import make_corpus
+from figuremate.export import compile_preview
+from figuremate.ingest import extract_text_and_figures
+
+APP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app.py")
+
+
+def make_report(figure_ids, paragraphs=8):
+    lines = ["# Synthetic Report"]
+    for i, fid in enumerate(figure_ids):
+        lines.append(f"\n## {i + 1}. Section\n")
+        lines.extend(f"Paragraph {j} about the method, with **numbers**: {j * 1.5}%." for j in range(paragraphs))
+        lines.append(f"[[{fid}]]")
+    return "\n".join(lines)
+
+
+def rerun_times(figures, blog, reruns):
+    """Seconds per AppTest rerun of app.py with `blog` as the finished report."""
+    at = AppTest.from_file(APP, default_timeout=120)
+    at.secrets["OPENAI_API_KEY"] = "sk-bench"
+    at.run()
+    at.session_state["final_result"] = {
+        "blog": blog, "hero_url": None, "hero_b64": None, "figures": figures,
+        "preview_md": compile_preview(blog, False, figures),
+    }
+    at.run()  # first paint
+    if at.exception:
+        raise RuntimeError(at.exception)
+
+    times = []
+    for _ in range(reruns):
+        start = time.perf_counter()
+        at.run()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--figures", type=int, default=40)
+    parser.add_argument("--image-size", type=int, default=1024)
+    parser.add_argument("--paragraphs", type=int, default=8, help="paragraphs per section")
+    parser.add_argument("--reruns", type=int, default=10)
+    args = parser.parse_args()
+
+    docs = max(1, args.figures // 10)
+    files = make_corpus(docs=docs, pages=-(-args.figures // docs), image_size=args.image_size)
+    _, figures, _ = extract_text_and_figures(files, workers=1, cache=False)
+    blog = make_report(list(figures)[:args.figures], args.paragraphs)
+
+    times = rerun_times(figures, blog, args.reruns)
+    print(f"figures={min(args.figures, len(figures))} image={args.image_size}px report={len(blog) / 1e3:.1f}k chars")
+    print(f"rerun: median {statistics.median(times) * 1000:7.1f} ms  min {min(times) * 1000:7.1f} ms  "
+          f"max {max(times) * 1000:7.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
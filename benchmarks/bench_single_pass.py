@@ -0,0 +1,100 @@
+"""Legacy two-pass page walk vs. the single-pass page pipeline.
+
+    python -m benchmarks.bench_single_pass --pages 200 --max-chars 15000 0
+
+Building a page's text layout (MuPDF's text page) dominates parsing; the
+single pass builds it once per page, the legacy walk once per page for the
+captions plus once per page read for the text. The legacy text pass stops
+at the text budget, so with the default 15k chars only the first few pages
+were read twice and the two are at parity. With no budget (`--max-chars 0`,
+the full-text/map-reduce mode) both legacy passes walk every page and the
+single pass roughly halves the work. Times are taken without tracemalloc,
+which slows both paths; the peak Python heap comes from a separate traced run.
+"""
+import argparse
+import re
+import time
+import tracemalloc
+
+import fitz  # PyMuPDF
+
+from benchmarks.synthetic import make_pdf
+from figuremate import assets
+from figuremate.ingest import parse_document
+
+
+def legacy_parse_document(pdf_bytes, max_chars=15000):
+    """The pre-single-pass implementation: one text pass, then one caption pass."""
+    doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+    chunks = []
+    total_chars = 0
+    for page in doc:
+        text = page.get_text()
+        if max_chars is not None and total_chars + len(text) > max_chars:
+            chunks.append(text[:max_chars - total_chars] + "\n...(Truncated)...")
+            break
+        chunks.append(text)
+        total_chars += len(text)
+
+    figures = []
+    caption_pat = re.compile(r"^(Figure|Fig)(\.|)\s*\d+", re.IGNORECASE)
+    for page_num, page in enumerate(doc):
+        for block in page.get_text("blocks"):
+            text = block[4].strip()
+            if not caption_pat.match(text):
+                continue
+            caption_rect = fitz.Rect(block[:4])
+            pr = page.rect
+            roi = fitz.Rect(pr.x0 + 30, max(0, caption_rect.y0 - 450), pr.x1 - 30, caption_rect.y0)
+            pix = page.get_pixmap(clip=roi, dpi=150)
+            if pix.width > 100 and pix.height > 100:
+                figures.append({"page": page_num + 1, "caption": text, "bytes": pix.tobytes("png"), "ext": "png"})
+    return "\n".join(chunks), figures
+
+
+def _measure(fn, pdf_bytes, repeat):
+    """(best seconds of `repeat` untraced runs, peak traced Python heap, result)."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(pdf_bytes)
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    fn(pdf_bytes)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--captions-per-page", type=int, default=0,
+                        help="0 isolates page parsing; >0 adds figure rasterization")
+    parser.add_argument("--text-repeat", type=int, default=30, help="filler paragraphs per page")
+    parser.add_argument("--max-chars", type=int, nargs="+", default=[15000, 0],
+                        help="text budgets to compare, one run each (0 = full text)")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    assets.PHOTO_FORMAT = "png"  # lossless like the legacy path, so only the page walk differs
+    pdf = make_pdf(pages=args.pages, captions_per_page=args.captions_per_page, text_repeat=args.text_repeat)
+    for max_chars in args.max_chars:
+        max_chars = max_chars or None
+        old_t, old_peak, old = _measure(lambda data: legacy_parse_document(data, max_chars), pdf, args.repeat)
+        new_t, new_peak, new = _measure(lambda data: parse_document(data, mode="render", max_chars=max_chars),
+                                        pdf, args.repeat)
+
+        assert old[0] == new[0], "text differs"
+        # figure bytes differ since transcoding (adaptive DPI, lossy photos); compare what was found
+        assert [(f["page"], f["caption"]) for f in old[1]] == [(f["page"], f["caption"]) for f in new[1]], \
+            "figures differ"
+
+        print(f"pages={args.pages} captions/page={args.captions_per_page} max-chars={max_chars or 'full'} "
+              f"figures={len(new[1])}")
+        print(f"  two-pass   : {old_t * 1000:8.1f} ms  peak py-heap {old_peak / 1e6:6.2f} MB")
+        print(f"  single-pass: {new_t * 1000:8.1f} ms  peak py-heap {new_peak / 1e6:6.2f} MB")
+        print(f"  speedup    : {old_t / new_t:8.2f}x")
+
+if __name__ == "__main__":
+    main()
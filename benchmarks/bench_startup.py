@@ -0,0 +1,65 @@
+"""Cold-start import time of the app, measured with `python -X importtime`.
+
+    python -m benchmarks.bench_startup --repeat 5 --top 15
+
+Imports `app` (what a fresh Streamlit server process does before the first
+page) in a new interpreter `--repeat` times and prints the median total, the
+heavy optional dependencies that got loaded, and the `--top` slowest modules
+by cumulative time. The "first upload" row also imports what ingestion and
+generation load on first use, for comparison.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+HEAVY = ("fitz", "pymupdf", "openai", "requests", "tiktoken", "PIL")
+TARGETS = {
+    "app": "import app",
+    "first upload": "import app, figuremate.ingest, figuremate.assets, openai, requests, tiktoken",
+}
+
+
+def _importtime(code):
+    """({module: (self_us, cumulative_us)}, top-level modules in import order) of one fresh interpreter."""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=root, PYTHONDONTWRITEBYTECODE="1")
+    stderr = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=root, env=env,
+                            capture_output=True, text=True, check=True).stderr
+    times, top_level = {}, []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        times[name.strip()] = (int(self_us), int(cumulative_us))
+        if not name[1:].startswith(" "):
+            top_level.append(name.strip())
+    return times, top_level
+
+
+def import_times(code, repeat):
+    """Seconds spent importing in each of `repeat` fresh interpreters running `code`, and the last run's modules."""
+    runs = [_importtime(code) for _ in range(repeat)]
+    return [sum(times[name][1] for name in top_level) / 1e6 for times, top_level in runs], runs[-1][0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    results = {label: import_times(code, args.repeat) for label, code in TARGETS.items()}
+    for label, (totals, times) in results.items():
+        loaded = [m for m in HEAVY if m in times]
+        print(f"{label:>12s}: {statistics.median(totals):6.3f}s  heavy deps loaded: {', '.join(loaded) or 'none'}")
+
+    _, times = results["app"]
+    print("\nslowest imports of `app` (cumulative ms):")
+    for name, (self_us, cumulative_us) in sorted(times.items(), key=lambda kv: -kv[1][1])[:args.top]:
+        print(f"  {cumulative_us / 1000:8.1f}  {self_us / 1000:7.1f} self  {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+"""Figure payload per photo format: stored bytes, thumbnails and export size.
+
+    python -m benchmarks.bench_transcode --pages 20 --image-size 1024
+
+"png" keeps every figure lossless (the previous behaviour); "jpeg"/"webp"
+store photographic figures lossy and leave line art as PNG.
+"""
+import argparse
+import time
+
+from benchmarks.synthetic import make_corpus
+from figuremate import assets
+from figuremate.export import export_file
+from figuremate.ingest import extract_text_and_figures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=3)
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--image-size", type=int, default=1024)
+    parser.add_argument("--vector-every", type=int, default=3)
+    parser.add_argument("--mode", default="embedded", choices=("embedded", "render"))
+    args = parser.parse_args()
+
+    files = make_corpus(docs=args.docs, pages=args.pages, image_size=args.image_size, vector_every=args.vector_every)
+    print(f"docs={args.docs} pages={args.pages} image={args.image_size}px mode={args.mode}")
+    base = None
+    for fmt in ("png", "jpeg", "webp"):
+        assets.PHOTO_FORMAT = fmt
+        start = time.perf_counter()
+        _, figures, _ = extract_text_and_figures(files, workers=1, cache=False, mode=args.mode)
+        elapsed = time.perf_counter() - start
+        payload = sum(len(f["bytes"]) for f in figures.values())
+        thumbs = sum(len(f["thumb"]) for f in figures.values())
+        blog = " ".join(f"[[{fid}]]" for fid in figures)
+        export = len(export_file("md", blog, None, figures).getvalue())
+        base = base or payload
+        print(f"{fmt:5s}: {elapsed:6.2f}s  figures={len(figures):3d}  payload={payload / 1e6:6.2f} MB "
+              f"({payload / base:.2f}x)  thumbs={thumbs / 1e6:5.2f} MB  md export={export / 1e6:6.2f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+"""End-to-end benchmark suite with a JSON report for comparing commits.
+
+    python -m benchmarks.suite --out bench.json
+    python -m benchmarks.suite --out new.json --compare bench.json
+
+Scenarios run on a synthetic corpus (see benchmarks.synthetic) against the
+local stub OpenAI server (figuremate.stub), so results are offline and
+repeatable. "ingest.add_document" re-ingests the set after one more upload
+(the others are reused). "pipeline" runs what the Generate button submits
+(ingest -> context -> report job -> exports); "pipeline.replay" runs it again
+with the stub shut down, from responses recorded by one pipeline run
+(FIGUREMATE_LLM_CACHE=replay). "rerun" is the Streamlit rerun with the
+finished report on screen (AppTest cannot upload files, so the UI part of
+main() is measured separately). "startup.import_app" is the cold import of
+app.py in a fresh interpreter (see benchmarks.bench_startup). Each scenario reports the median and minimum
+of --repeat runs; --compare flags scenarios slower than --threshold x the
+baseline and exits non-zero.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from benchmarks.bench_rerun import make_report, rerun_times
+from benchmarks.bench_startup import HEAVY, import_times
+from benchmarks.synthetic import make_corpus
+from figuremate import llm
+from figuremate.cache import configure_response_cache
+from figuremate.context import select_context
+from figuremate.export import compile_markdown_export, export_file
+from figuremate.ingest import extract_text_and_figures
+from figuremate.jobs import JobManager
+from figuremate.report import (
+    build_asset_list, build_context, generate_report, refine_report, run_report_pipeline,
+)
+from figuremate.stub import start_stub
+
+
+def _timed(fn, repeat):
+    times, result = [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return times, result
+
+
+def _stats(times, **extra):
+    return {"median_s": round(statistics.median(times), 6), "min_s": round(min(times), 6), "runs": len(times), **extra}
+
+
+def _commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+# ============================================================
+# SCENARIOS
+# ============================================================
+
+def run_suite(args):
+    files = make_corpus(docs=args.docs, pages=args.pages, captions_per_page=args.captions_per_page,
+                        image_size=args.image_size)
+    results = {}
+
+    def record(name, times, **extra):
+        results[name] = _stats(times, **extra)
+        print(f"{name:22s} median {results[name]['median_s'] * 1000:9.1f} ms", file=sys.stderr, flush=True)
+
+    times, (full_text, figures, _) = _timed(
+        lambda: extract_text_and_figures(files, workers=1, cache=False, max_doc_chars=None), args.repeat)
+    record("ingest.serial", times, figures=len(figures), chars=len(full_text))
+    times, _ = _timed(lambda: extract_text_and_figures(files, cache=False, max_doc_chars=None), args.repeat)
+    record("ingest.parallel", times)
+    base = {}
+    extract_text_and_figures(files[:-1], workers=1, cache=False, max_doc_chars=None, state=base)
+    times, _ = _timed(lambda: extract_text_and_figures(files, workers=1, cache=False, max_doc_chars=None,
+                                                       state={k: dict(v) for k, v in base.items()}), args.repeat)
+    record("ingest.add_document", times)
+
+    times, _ = _timed(lambda: build_asset_list(figures), args.repeat * 10)
+    record("prompt.asset_list", times)
+    times, (context, tokens) = _timed(lambda: select_context(full_text, figures, "gpt-4o"), args.repeat)
+    record("prompt.select_context", times, tokens=tokens)
+
+    blog = make_report(list(figures))
+    times, (_, download_md) = _timed(lambda: compile_markdown_export(blog, None, figures), args.repeat)
+    record("export.markdown", times, bytes=len(download_md.encode()))
+    times, buf = _timed(lambda: export_file("zip", blog, None, figures), args.repeat)
+    record("export.zip", times, bytes=len(buf.getvalue()))
+
+    responses = None
+    server, base_url = start_stub(latency=args.latency)
+    os.environ["OPENAI_BASE_URL"] = base_url
+    for model in list(llm.RATE_LIMITS):
+        llm.configure_rate_limit(model, 1_000_000)  # the stub has no quotas
+    try:
+        times, report = _timed(lambda: generate_report("sk-bench", context, figures), args.repeat)
+        record("llm.generate_report", times, stub_latency_s=args.latency)
+        times, _ = _timed(lambda: refine_report("sk-bench", report, "Make it shorter.", figures), args.repeat)
+        record("llm.refine_report", times, stub_latency_s=args.latency)
+
+        manager = JobManager(workers=1)
+
+        def pipeline():
+            text, registry, _ = extract_text_and_figures(files, workers=1, cache=False, max_doc_chars=None)
+            ctx, _ = build_context(text, registry, "gpt-4o")
+            job = manager.submit("bench", run_report_pipeline, "sk-bench", ctx, registry, "gpt-4o", hero_grace=None)
+            while job.active:
+                time.sleep(0.005)
+            res = job.result
+            for kind in ("md", "zip"):
+                export_file(kind, res["blog"], res["hero_b64"], registry)
+            return res
+
+        times, _ = _timed(pipeline, args.repeat)
+        record("pipeline.generate", times, stub_latency_s=args.latency)
+
+        # Record one run's responses, then replay them with the stub gone (fully offline)
+        responses = tempfile.mkdtemp(prefix="figuremate-responses-")
+        configure_response_cache("on", responses)
+        pipeline()
+    finally:
+        server.shutdown()
+    if responses:
+        configure_response_cache("replay", responses)
+        try:
+            times, res = _timed(pipeline, args.repeat)
+        finally:
+            configure_response_cache("off")
+        record("pipeline.replay", times, hero=bool(res["hero_b64"]))
+
+    if not args.skip_ui:
+        times = rerun_times(figures, blog, args.repeat)
+        record("ui.rerun", times, figures=len(figures))
+        times, modules = import_times("import app", args.repeat)
+        record("startup.import_app", times, heavy=[m for m in HEAVY if m in modules])
+    return results
+
+
+# ============================================================
+# REPORT
+# ============================================================
+
+def compare(results, baseline, threshold, min_delta):
+    """Prints new/old ratios. Returns the names of scenarios slower than `threshold`x
+    and by more than `min_delta` seconds (sub-millisecond scenarios are mostly jitter)."""
+    regressions = []
+    print(f"{'scenario':22s} {'baseline':>10s} {'current':>10s} {'ratio':>7s}")
+    for name, cur in results.items():
+        old = baseline.get("scenarios", {}).get(name)
+        if not old:
+            print(f"{name:22s} {'-':>10s} {cur['median_s'] * 1000:8.1f}ms {'new':>7s}")
+            continue
+        ratio = cur["median_s"] / old["median_s"] if old["median_s"] else float("inf")
+        slower = ratio > threshold and cur["median_s"] - old["median_s"] > min_delta
+        flag = "  REGRESSION" if slower else ""
+        print(f"{name:22s} {old['median_s'] * 1000:8.1f}ms {cur['median_s'] * 1000:8.1f}ms {ratio:6.2f}x{flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=3)
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--captions-per-page", type=int, default=1)
+    parser.add_argument("--image-size", type=int, default=512)
+    parser.add_argument("--latency", type=float, default=0.05, help="stub seconds per API call")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--skip-ui", action="store_true", help="skip the Streamlit rerun scenario")
+    parser.add_argument("--out", help="write the JSON report here (default: stdout)")
+    parser.add_argument("--compare", help="baseline JSON report from another commit")
+    parser.add_argument("--threshold", type=float, default=1.2, help="ratio that counts as a regression")
+    parser.add_argument("--min-delta", type=float, default=0.005, help="seconds a regression must also exceed")
+    args = parser.parse_args()
+
+    params = {k: v for k, v in vars(args).items() if k not in ("out", "compare", "threshold", "min_delta", "skip_ui")}
+    report = {
+        "meta": {
+            "commit": _commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "params": params,
+        },
+        "scenarios": run_suite(args),
+    }
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("meta", {}).get("params") != params:
+            print("warning: baseline was recorded with different parameters", file=sys.stderr)
+        if compare(report["scenarios"], baseline, args.threshold, args.min_delta):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
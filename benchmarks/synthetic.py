@@ -0,0 +1,69 @@
+"""Synthetic PDF corpus for FigureMate benchmarks."""
+import random
+
+import fitz  # PyMuPDF
+
+from figuremate.ingest import NamedBytesIO
+
+LOREM = (
+    "Transformer encoders map token sequences to contextual embeddings. "
+    "We evaluate latency, throughput and accuracy across several hardware targets. "
+    "The proposed method reduces memory traffic by fusing attention kernels. "
+)
+
+
+def _noise_pixmap(rng, size):
+    return fitz.Pixmap(fitz.csRGB, size, size, rng.randbytes(size * size * 3), False)
+
+
+def _draw_vector_figure(page, rect, rng):
+    """A bar chart made of drawing commands only (no embedded image)."""
+    page.draw_rect(rect, color=(0, 0, 0), width=0.8)
+    bars = 8
+    width = rect.width / (bars * 1.5)
+    for i in range(bars):
+        x0 = rect.x0 + width * (0.5 + i * 1.5)
+        height = rect.height * rng.uniform(0.1, 0.9)
+        page.draw_rect(fitz.Rect(x0, rect.y1 - height, x0 + width, rect.y1), color=None, fill=(0.15, 0.39, 0.92))
+
+
+def make_pdf(pages=40, captions_per_page=1, image_size=256, seed=0, text_repeat=30, vector_every=0, columns=1):
+    """Builds a PDF with body text and `captions_per_page` captioned figures per page and column.
+
+    Figures are distinct embedded raster images, except every `vector_every`-th
+    one, which is drawn with vector commands. `text_repeat` sets how many
+    sentences of filler text a figure-less page carries. `columns=2` lays
+    pages out in two columns.
+    """
+    rng = random.Random(seed)
+    doc = fitz.open()
+    fig_no = 1
+    col_width = (468 - 18 * (columns - 1)) / columns
+    for _ in range(pages):
+        page = doc.new_page(width=612, height=792)
+        for col in range(columns):
+            x0 = 72 + col * (col_width + 18)
+            y = 60
+            slot = (792 - 120) / max(captions_per_page, 1)
+            for _ in range(captions_per_page):
+                img_rect = fitz.Rect(x0 + 48, y, x0 + col_width - 48, y + slot * 0.55)
+                if vector_every and fig_no % vector_every == 0:
+                    _draw_vector_figure(page, img_rect, rng)
+                else:
+                    page.insert_image(img_rect, pixmap=_noise_pixmap(rng, image_size))
+                cap_rect = fitz.Rect(x0, img_rect.y1 + 6, x0 + col_width, img_rect.y1 + 30)
+                page.insert_textbox(cap_rect, f"Figure {fig_no}. Synthetic result {fig_no}.", fontsize=9)
+                body_rect = fitz.Rect(x0, cap_rect.y1 + 4, x0 + col_width, y + slot)
+                page.insert_textbox(body_rect, LOREM * 4, fontsize=8)
+                fig_no += 1
+                y += slot
+        if captions_per_page == 0:
+            page.insert_textbox(fitz.Rect(72, 60, 540, 740), LOREM * text_repeat, fontsize=8)
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+def make_corpus(docs=5, pages=40, **kwargs):
+    """Returns a list of NamedBytesIO uploads named paper_1.pdf ... paper_N.pdf."""
+    return [NamedBytesIO(make_pdf(pages=pages, seed=i, **kwargs), f"paper_{i + 1}.pdf") for i in range(docs)]
@@ -0,0 +1 @@
+"""FigureMate AI core engine (UI-independent)."""
@@ -0,0 +1,40 @@
+import argparse
+import sys
+
+from figuremate.batch import DEFAULT_BATCH_WORKERS, EXPORT_FORMATS, run_batch
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m figuremate", description="FigureMate AI without the Streamlit UI.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    batch = commands.add_parser(
+        "batch", help="generate one report per document set in a directory",
+        description="Each subdirectory of DIR holding PDFs is one report; PDFs directly in DIR are one report each. "
+                    "Rerunning resumes: sets recorded as done in OUT/manifest.jsonl are skipped.",
+    )
+    batch.add_argument("dir")
+    batch.add_argument("--out", help="output directory (default: DIR/figuremate_out)")
+    batch.add_argument("--workers", type=int, default=DEFAULT_BATCH_WORKERS, help="document sets processed at once")
+    batch.add_argument("--ingest-workers", type=int, default=1, help="PDF parsing processes per set")
+    batch.add_argument("--model", default="gpt-4o", choices=["gpt-4o", "gpt-4o-mini"])
+    batch.add_argument("--format", dest="formats", action="append", choices=EXPORT_FORMATS,
+                       help="export format, repeatable (default: md)")
+    batch.add_argument("--map-reduce", action="store_true", help="summarize every document in full first")
+    batch.add_argument("--no-hero", dest="hero", action="store_false", help="skip the DALL-E hero image")
+    batch.add_argument("--force", action="store_true", help="regenerate sets the manifest marks as done")
+    batch.add_argument("--stub", nargs="?", type=float, const=0.0, default=None, metavar="LATENCY",
+                       help="answer LLM calls from a local stub server (optional per-call latency in seconds)")
+
+    args = parser.parse_args(argv)
+    if args.command == "batch":
+        return 1 if run_batch(
+            args.dir, args.out, workers=args.workers, model=args.model, formats=args.formats or ["md"],
+            map_reduce=args.map_reduce, hero=args.hero, force=args.force,
+            ingest_workers=args.ingest_workers, stub_latency=args.stub,
+        ) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,100 @@
+import io
+import os
+
+import fitz  # PyMuPDF
+
+try:
+    from PIL import Image
+except ImportError:  # optional: photos fall back to JPEG
+    Image = None
+
+# Photographic figures: "webp" (needs Pillow), "jpeg", or "png" to keep everything lossless
+PHOTO_FORMAT = os.environ.get("FIGUREMATE_PHOTO_FORMAT", "webp")
+PHOTO_QUALITY = int(os.environ.get("FIGUREMATE_PHOTO_QUALITY", "80"))
+
+MAX_FIGURE_PX = 1600      # long side of stored figures
+MIN_DPI, MAX_DPI = 72, 150
+THUMB_PX = 320            # long side of sidebar thumbnails
+PHOTO_MIN_COLORS = 2048   # distinct colours (measured on the thumbnail) that mark a photo
+DISPLAY_MAX_PX = 1460     # Streamlit's widest content column; st.image resizes anything wider
+
+
+def choose_dpi(rect):
+    """DPI that renders `rect` at most MAX_FIGURE_PX on its long side, within MIN/MAX_DPI."""
+    long_side = max(rect.width, rect.height) or 1
+    return int(max(MIN_DPI, min(MAX_DPI, MAX_FIGURE_PX * 72 / long_side)))
+
+
+def _normalize(pix):
+    """RGB/gray pixmap, without alpha unless it carries transparency."""
+    if pix.colorspace is None or pix.colorspace.n not in (1, 3):
+        pix = fitz.Pixmap(fitz.csRGB, pix)
+    if pix.alpha and min(pix.samples[pix.n - 1::pix.n]) == 255:
+        pix = fitz.Pixmap(pix, 0)  # alpha channel is fully opaque: drop it
+    return pix
+
+
+def _scaled(pix, max_px):
+    long_side = max(pix.width, pix.height)
+    if long_side <= max_px:
+        return pix
+    scale = max_px / long_side
+    return fitz.Pixmap(pix, max(1, int(pix.width * scale)), max(1, int(pix.height * scale)), None)
+
+
+def _encode_photo(pix):
+    if PHOTO_FORMAT == "webp" and Image is not None and pix.n in (1, 3):
+        mode = "L" if pix.n == 1 else "RGB"
+        buf = io.BytesIO()
+        Image.frombytes(mode, (pix.width, pix.height), pix.samples).save(buf, "WEBP", quality=PHOTO_QUALITY, method=2)
+        return buf.getvalue(), "webp"
+    return pix.tobytes("jpeg", jpg_quality=PHOTO_QUALITY), "jpeg"
+
+
+def encode_figure(pix, original=None):
+    """Encodes a figure pixmap for storage. Returns {"bytes", "ext", "thumb"}.
+
+    The figure is capped at MAX_FIGURE_PX; photographic content (many distinct
+    colours) is stored lossy as WebP/JPEG, line art and transparency as PNG.
+    `original=(bytes, ext)` is an already-encoded embedded image that is kept
+    when it is a JPEG within the size cap, or smaller than the re-encode.
+    """
+    pix = _normalize(pix)
+    full = _scaled(pix, MAX_FIGURE_PX)
+    thumb = _scaled(full, THUMB_PX)
+    photo = PHOTO_FORMAT != "png" and not full.alpha and thumb.color_count() >= PHOTO_MIN_COLORS
+
+    if original and full is pix and original[1] == "jpeg":
+        data, ext = original  # don't re-encode a JPEG twice
+    else:
+        data, ext = _encode_photo(full) if photo else (full.tobytes("png"), "png")
+        if original and full is pix and len(original[0]) <= len(data) and original[1] in ("png", "jpeg"):
+            data, ext = original
+
+    if thumb.alpha:
+        thumb_bytes = thumb.tobytes("png")
+    else:
+        thumb_bytes = thumb.tobytes("jpeg", jpg_quality=70)
+    return {"bytes": data, "ext": ext, "thumb": thumb_bytes}
+
+
+def display_image(data, ext):
+    """Browser-ready (bytes, "PNG" | "JPEG") for st.image.
+
+    st.image re-encodes formats other than PNG/JPEG (WebP) and downsizes images
+    wider than DISPLAY_MAX_PX on every call; doing it once here lets callers
+    memoize the result per figure.
+    """
+    if Image is None:
+        return data, "JPEG" if ext == "jpeg" else "PNG"
+    img = Image.open(io.BytesIO(data))
+    fmt = "PNG" if img.format == "PNG" or "A" in img.getbands() or img.mode == "P" else "JPEG"
+    if img.width <= DISPLAY_MAX_PX and img.format == fmt:
+        return data, fmt
+    if img.width > DISPLAY_MAX_PX:
+        img = img.resize((DISPLAY_MAX_PX, max(1, img.height * DISPLAY_MAX_PX // img.width)), Image.BILINEAR)
+    if fmt == "JPEG" and img.mode not in ("RGB", "L"):
+        img = img.convert("RGB")
+    buf = io.BytesIO()
+    img.save(buf, fmt, quality=90)
+    return buf.getvalue(), fmt
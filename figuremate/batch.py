@@ -0,0 +1,227 @@
+import contextvars
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from figuremate import llm
+from figuremate.cache import content_digest, file_digest
+from figuremate.context import has_text
+from figuremate.export import write_markdown_export, write_zip_export
+from figuremate.ingest import extract_text_and_figures
+from figuremate.report import build_context, run_report_pipeline
+from figuremate.trace import Trace, use_trace
+
+MANIFEST_NAME = "manifest.jsonl"
+DEFAULT_BATCH_WORKERS = 4
+EXPORT_FORMATS = ("md", "zip")
+
+
+# ============================================================
+# 1. DOCUMENT SETS & MANIFEST
+# ============================================================
+
+def find_document_sets(root):
+    """[(name, [pdf paths])] under `root`: every subdirectory holding PDFs is one
+    set (one report over all of them); PDFs directly in `root` are one set each.
+
+    Set names are unique (ignoring case): a root-level `foo.pdf` next to a
+    directory `foo/` becomes set `foo-2`, so the two never share outputs.
+    """
+    sets = []
+    taken = set()
+    for entry in sorted(os.scandir(root), key=lambda e: e.name):
+        if entry.is_dir():
+            pdfs = sorted(os.path.join(entry.path, f) for f in os.listdir(entry.path) if f.lower().endswith(".pdf"))
+            if not pdfs:
+                continue
+            base = entry.name
+        elif entry.name.lower().endswith(".pdf"):
+            base, pdfs = os.path.splitext(entry.name)[0], [entry.path]
+        else:
+            continue
+        name, n = base, 2
+        while name.casefold() in taken:
+            name, n = f"{base}-{n}", n + 1
+        if name != base:
+            print(f"[{entry.name}] set name {base!r} is taken, using {name!r}", file=sys.stderr, flush=True)
+        taken.add(name.casefold())
+        sets.append((name, pdfs))
+    return sets
+
+
+def fingerprint(paths, options):
+    """Digest of the set's PDFs (names + contents) and the options that shape its report."""
+    lines = [f"{os.path.basename(p)}:{file_digest(p)}" for p in paths]
+    lines.append(json.dumps(options, sort_keys=True))
+    return content_digest("\n".join(lines).encode())
+
+
+class Manifest:
+    """Append-only JSON-lines log of finished sets; the last record per set wins.
+
+    Appending one line per set means a crash loses at most the sets in flight,
+    and a rerun skips everything already recorded as done with the same inputs.
+    Outputs are recorded relative to the manifest's directory (the output
+    directory), so reruns from another working directory still find them.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.root = os.path.dirname(os.path.abspath(path))
+        self.records = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # torn last line from an interrupted run
+                    self.records[record["set"]] = record
+
+    def is_done(self, name, inputs):
+        record = self.records.get(name)
+        return bool(record and record["status"] == "done" and record["inputs"] == inputs
+                    and all(os.path.exists(self.resolve(p)) for p in record["outputs"]))
+
+    def resolve(self, output):
+        """Absolute path of a recorded output."""
+        return os.path.join(self.root, output)
+
+    def add(self, record):
+        with self._lock:
+            self.records[record["set"]] = record
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record) + "\n")
+
+
+# ============================================================
+# 2. ONE DOCUMENT SET
+# ============================================================
+
+class _StageLog:
+    """Minimal job handle for run_report_pipeline: prints stages, ignores the draft."""
+
+    def __init__(self, name):
+        self.name = name
+
+    def set_stage(self, stage):
+        print(f"[{self.name}] {stage}", file=sys.stderr, flush=True)
+
+    def append(self, text):
+        pass
+
+
+def _write_atomic(path, mode, writer):
+    tmp = f"{path}.tmp"
+    try:
+        with open(tmp, mode, **({"encoding": "utf-8"} if "b" not in mode else {})) as f:
+            writer(f)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def run_set(name, paths, out_dir, api_key, options, ingest_workers=1):
+    """Ingests, generates and exports one set. Returns the output paths; raises RuntimeError on failure."""
+    full_text, figures, _ = extract_text_and_figures(paths, workers=ingest_workers, max_doc_chars=None)
+    if not full_text:
+        raise RuntimeError("no readable PDFs")
+    context, _ = build_context(full_text, figures, options["model"], options["map_reduce"])
+    if not has_text(context):
+        raise RuntimeError("no extractable text (scanned PDFs need OCR first)")
+    result = run_report_pipeline(
+        _StageLog(name), api_key, context, figures, options["model"],
+        map_reduce=options["map_reduce"], stream=False, hero=options["hero"], hero_grace=None,
+    )
+    if isinstance(result, str):
+        raise RuntimeError(result)
+
+    set_dir = os.path.join(out_dir, name)
+    os.makedirs(set_dir, exist_ok=True)
+    outputs = []
+    args = (result["blog"], result["hero_b64"], figures)
+    if "md" in options["formats"]:
+        outputs.append(os.path.join(set_dir, "report.md"))
+        _write_atomic(outputs[-1], "w", lambda f: write_markdown_export(f, *args))
+    if "zip" in options["formats"]:
+        outputs.append(os.path.join(set_dir, "report.zip"))
+        _write_atomic(outputs[-1], "wb", lambda f: write_zip_export(f, *args))
+    return outputs
+
+
+# ============================================================
+# 3. BATCH DRIVER
+# ============================================================
+
+def run_batch(root, out_dir=None, workers=DEFAULT_BATCH_WORKERS, model="gpt-4o", formats=("md",),
+              map_reduce=False, hero=True, force=False, ingest_workers=1, api_key=None, stub_latency=None):
+    """Generates one report per document set of `root` with a pool of `workers` threads.
+
+    Sets already recorded as done in `<out_dir>/manifest.jsonl` with the same
+    inputs and options are skipped unless `force`. `stub_latency` (seconds)
+    serves every LLM call from the in-process stub server instead of OpenAI.
+    Returns the number of failed sets.
+    """
+    out_dir = out_dir or os.path.join(root, "figuremate_out")
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = Manifest(os.path.join(out_dir, MANIFEST_NAME))
+    options = {"model": model, "formats": sorted(formats), "map_reduce": map_reduce, "hero": hero}
+
+    if stub_latency is not None:
+        from figuremate.stub import start_stub
+        _, base_url = start_stub(latency=stub_latency)
+        os.environ["OPENAI_BASE_URL"] = base_url
+        api_key = "sk-stub"
+        for name in list(llm.RATE_LIMITS):
+            llm.configure_rate_limit(name, 1_000_000)  # the stub has no quotas
+    api_key = api_key or os.environ.get("OPENAI_API_KEY", "")
+    if not api_key:
+        raise SystemExit("OPENAI_API_KEY is not set (or pass --stub).")
+
+    pending = []
+    skipped = 0
+    for name, paths in find_document_sets(root):
+        inputs = fingerprint(paths, options)
+        if not force and manifest.is_done(name, inputs):
+            skipped += 1
+            continue
+        pending.append((name, paths, inputs))
+
+    def work(name, paths, inputs):
+        start = time.perf_counter()
+        record = {"set": name, "inputs": inputs, "files": [os.path.basename(p) for p in paths], "outputs": []}
+        try:
+            outputs = run_set(name, paths, out_dir, api_key, options, ingest_workers)
+            record["outputs"] = [os.path.relpath(p, manifest.root) for p in outputs]
+            record["status"] = "done"
+        except Exception as e:
+            record["status"], record["error"] = "failed", str(e)
+        record["seconds"] = round(time.perf_counter() - start, 3)
+        manifest.add(record)
+        return record
+
+    start = time.perf_counter()
+    failed = 0
+    trace = Trace()
+    with use_trace(trace), ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="figuremate-batch") as pool:
+        futures = [pool.submit(contextvars.copy_context().run, work, *item) for item in pending]
+        for future in as_completed(futures):
+            record = future.result()
+            failed += record["status"] != "done"
+            detail = record.get("error") or ", ".join(manifest.resolve(p) for p in record["outputs"])
+            print(f"{record['status']:6s} {record['set']} ({record['seconds']:.1f}s) {detail}", flush=True)
+
+    elapsed = time.perf_counter() - start
+    done = len(pending) - failed
+    rate = f", {done / elapsed * 60:.1f} sets/min" if done and elapsed else ""
+    print(f"{done} done, {failed} failed, {skipped} skipped in {elapsed:.1f}s{rate}. Manifest: {manifest.path}")
+    for model, u in trace.usage().items():
+        print(f"  {model}: {u['calls']} calls, {u['prompt_tokens']} prompt + {u['completion_tokens']} completion tokens,"
+              f" {u['images']} images, ${u['cost']:.4f}")
+    return failed
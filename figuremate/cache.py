@@ -0,0 +1,250 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+
+# Shared on-disk ingestion cache (set FIGUREMATE_CACHE_DIR="" to disable).
+DEFAULT_CACHE_DIR = os.environ.get(
+    "FIGUREMATE_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "figuremate", "ingest")
+)
+DEFAULT_CACHE_MAX_MB = int(os.environ.get("FIGUREMATE_CACHE_MAX_MB", "512"))
+CACHE_FORMAT = 2  # bump when the entry layout changes; old entries are then evicted as unused
+
+# Opt-in LLM response cache: "off", "on" (serve and record) or "replay" (serve
+# recorded responses only; a miss is an error instead of an API call).
+RESPONSE_CACHE_MODE = os.environ.get("FIGUREMATE_LLM_CACHE", "off")
+RESPONSE_CACHE_DIR = os.environ.get(
+    "FIGUREMATE_LLM_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "figuremate", "llm")
+)
+RESPONSE_CACHE_TTL = int(os.environ.get("FIGUREMATE_LLM_CACHE_TTL", str(7 * 24 * 3600)))  # seconds, 0 = forever
+RESPONSE_CACHE_MAX_MB = int(os.environ.get("FIGUREMATE_LLM_CACHE_MAX_MB", "256"))
+
+
+def content_digest(data):
+    """SHA-256 hex digest of a PDF's bytes; the cache key."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def file_digest(source, chunk_size=1 << 20):
+    """content_digest of a file path or binary file object, read in chunks."""
+    digest = hashlib.sha256()
+    f = open(source, "rb") if isinstance(source, str) else source
+    try:
+        f.seek(0)
+        for block in iter(lambda: f.read(chunk_size), b""):
+            digest.update(block)
+    finally:
+        if f is not source:
+            f.close()
+    return digest.hexdigest()
+
+
+class IngestCache:
+    """Content-addressed store of parsed PDFs, shared across sessions and restarts.
+
+    Each entry is a directory `<root>/v<format>-<digest>/` holding `meta.json`
+    (text, figure metadata) and one file per bytes field of each figure
+    (image, thumbnail). Entries are written to a
+    temp directory and renamed into place, so concurrent writers never expose
+    half-written entries. Reads refresh the entry's mtime; when the total size
+    exceeds `max_bytes` the least recently used entries are evicted.
+    """
+
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        os.makedirs(root, exist_ok=True)
+
+    def _entry(self, digest):
+        return os.path.join(self.root, f"v{CACHE_FORMAT}-{digest}")
+
+    def get(self, digest):
+        """Returns (text, figures) for a digest, or None on a miss."""
+        entry = self._entry(digest)
+        meta_path = os.path.join(entry, "meta.json")
+        try:
+            with open(meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+            figures = []
+            for fig in meta["figures"]:
+                for key, name in fig.pop("files").items():
+                    with open(os.path.join(entry, name), "rb") as f:
+                        fig[key] = f.read()
+                figures.append(fig)
+            os.utime(meta_path)
+        except (OSError, ValueError, KeyError):
+            return None
+        return meta["text"], figures
+
+    def put(self, digest, text, figures):
+        entry = self._entry(digest)
+        if os.path.exists(entry):
+            return
+        tmp = tempfile.mkdtemp(prefix=".tmp-", dir=self.root)
+        try:
+            meta = {"text": text, "figures": []}
+            for i, fig in enumerate(figures):
+                files = {}
+                for key, value in fig.items():
+                    if isinstance(value, bytes):
+                        files[key] = f"fig_{i:03d}.{key}"
+                        with open(os.path.join(tmp, files[key]), "wb") as f:
+                            f.write(value)
+                meta["figures"].append({k: v for k, v in fig.items() if k not in files} | {"files": files})
+            with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as f:
+                json.dump(meta, f, ensure_ascii=False)
+            os.rename(tmp, entry)
+        except OSError:
+            # Lost a race with another writer, or the disk is full; the cache is best-effort.
+            shutil.rmtree(tmp, ignore_errors=True)
+            return
+        self.evict()
+
+    def evict(self):
+        """Drops least recently used entries until the cache fits in max_bytes."""
+        entries = []
+        total = 0
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if name.startswith(".tmp-") or not os.path.isdir(path):
+                continue
+            try:
+                size = sum(e.stat().st_size for e in os.scandir(path))
+                last_used = os.stat(os.path.join(path, "meta.json")).st_mtime
+            except OSError:
+                continue
+            entries.append((last_used, size, path))
+            total += size
+        entries.sort()
+        while total > self.max_bytes and entries:
+            _, size, path = entries.pop(0)
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+
+
+_default_cache = None
+
+
+def default_cache():
+    """Process-wide IngestCache, or None when caching is disabled."""
+    global _default_cache
+    if _default_cache is None and DEFAULT_CACHE_DIR:
+        try:
+            _default_cache = IngestCache(DEFAULT_CACHE_DIR, DEFAULT_CACHE_MAX_MB * 1024 * 1024)
+        except OSError:
+            return None
+    return _default_cache
+
+
+def response_key(kind, model, prompt, temperature):
+    """Digest of everything that determines a response: call kind, model, prompt, temperature."""
+    payload = json.dumps([kind, model, temperature, prompt], ensure_ascii=False, sort_keys=True)
+    return content_digest(payload.encode())
+
+
+class ResponseCache:
+    """LLM responses on disk, one JSON file per response_key.
+
+    Entries older than `ttl` seconds (0 = never) are misses and get removed;
+    the replay store uses ttl 0 so recorded fixtures never expire.
+    Reads refresh the file's mtime; when the total size exceeds `max_bytes`
+    the least recently used entries are evicted. Files are written to a temp
+    name and renamed into place.
+    """
+
+    def __init__(self, root, max_bytes, ttl):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.root, f"{key}.json")
+
+    def get(self, key):
+        """Returns the stored value, or None on a miss."""
+        path = self._path(key)
+        try:
+            with open(path, encoding="utf-8") as f:
+                entry = json.load(f)
+            if self.ttl and time.time() - entry["created"] > self.ttl:
+                os.remove(path)
+                return None
+            os.utime(path)
+        except (OSError, ValueError, KeyError):
+            return None
+        return entry["value"]
+
+    def put(self, key, value, **meta):
+        """Stores a JSON-serializable value; `meta` (kind, model...) is kept for inspection only."""
+        fd, tmp = tempfile.mkstemp(prefix=".tmp-", dir=self.root)
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"created": time.time(), **meta, "value": value}, f, ensure_ascii=False)
+            os.replace(tmp, self._path(key))
+        except OSError:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            return
+        self.evict()
+
+    def evict(self):
+        """Drops expired entries, then least recently used ones until the cache fits in max_bytes."""
+        now = time.time()
+        entries = []
+        total = 0
+        for entry in os.scandir(self.root):
+            if entry.name.startswith(".tmp-") or not entry.name.endswith(".json"):
+                continue
+            try:
+                stat = entry.stat()
+                if self.ttl and now - stat.st_mtime > self.ttl:
+                    os.remove(entry.path)
+                    continue
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total += stat.st_size
+        entries.sort()
+        while total > self.max_bytes and entries:
+            _, size, path = entries.pop(0)
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+
+_response_cache = None
+
+
+def configure_response_cache(mode, root=None, ttl=None, max_mb=None):
+    """Switches the response cache at runtime (e.g. "replay" from a recorded dir in tests).
+
+    `ttl` only applies to "on"; replayed entries never expire.
+    """
+    global RESPONSE_CACHE_MODE, RESPONSE_CACHE_DIR, RESPONSE_CACHE_TTL, RESPONSE_CACHE_MAX_MB, _response_cache
+    RESPONSE_CACHE_MODE = mode
+    RESPONSE_CACHE_DIR = root or RESPONSE_CACHE_DIR
+    RESPONSE_CACHE_TTL = RESPONSE_CACHE_TTL if ttl is None else ttl
+    RESPONSE_CACHE_MAX_MB = max_mb or RESPONSE_CACHE_MAX_MB
+    _response_cache = None
+
+
+def replaying():
+    """True when responses may only come from recorded entries (FIGUREMATE_LLM_CACHE=replay)."""
+    return RESPONSE_CACHE_MODE == "replay"
+
+
+def default_response_cache():
+    """Process-wide ResponseCache, or None when the response cache is off."""
+    global _response_cache
+    if _response_cache is None and RESPONSE_CACHE_MODE in ("on", "replay"):
+        try:
+            _response_cache = ResponseCache(RESPONSE_CACHE_DIR, RESPONSE_CACHE_MAX_MB * 1024 * 1024,
+                                            0 if replaying() else RESPONSE_CACHE_TTL)
+        except OSError:
+            return None
+    return _response_cache
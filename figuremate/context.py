@@ -0,0 +1,242 @@
+import math
+import os
+import re
+import threading
+from collections import Counter
+from concurrent.futures import Future
+
+from figuremate.sections import DOC_HEADER_PAT, doc_header
+
+# Source-text token budget per model for single-pass generation
+CONTEXT_BUDGETS = {"gpt-4o": 24000, "gpt-4o-mini": 24000}
+DEFAULT_CONTEXT_BUDGET = 24000
+CHUNK_CHARS = 1500
+
+# tiktoken encoding per model. BPE files are read from TOKENIZER_DIR (used as
+# TIKTOKEN_CACHE_DIR when it exists and that is not set), filled at build time
+# so air-gapped hosts count real tokens; otherwise tiktoken downloads them, in
+# the background.
+ENCODINGS = {"gpt-4o": "o200k_base", "gpt-4o-mini": "o200k_base"}
+DEFAULT_ENCODING = "o200k_base"
+TOKENIZER_DIR = os.environ.get("FIGUREMATE_TOKENIZER_DIR") or os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "vendor", "tiktoken")
+TOKENIZER_TIMEOUT = float(os.environ.get("FIGUREMATE_TOKENIZER_TIMEOUT", "3"))  # seconds the first count may wait
+
+_encodings = {}  # encoding name -> Future
+_encodings_lock = threading.Lock()
+
+FIGURE_BOOST = 0.5        # added per reference to a captioned figure (capped at 3)
+BOILERPLATE_WEIGHT = 0.2  # multiplier for reference lists, headers and footers
+
+_WORD_PAT = re.compile(r"\w+", re.UNICODE)
+_FIG_REF_PAT = re.compile(r"\b(?:Figure|Fig)\.?\s*(\d+)", re.IGNORECASE)
+_CITATION_PAT = re.compile(r"\[\d+(?:[,–-]\s*\d+)*\]|\bet al\.|\b(?:19|20)\d{2}[a-z]?\b|doi:|arXiv", re.IGNORECASE)
+_REFERENCES_PAT = re.compile(r"^\s*(?:references|bibliography|참고\s*문헌)\s*$", re.IGNORECASE | re.MULTILINE)
+_STOPWORDS = frozenset(
+    "the a an and or of to in on for with by is are was were be this that these those as at from we our it its "
+    "which can has have not also than into using used based such between their".split()
+)
+
+
+# ============================================================
+# 1. TOKEN COUNTING
+# ============================================================
+
+def _load_encoding(name, future):
+    try:
+        # tiktoken downloads a missing BPE file (no timeout) into TIKTOKEN_CACHE_DIR
+        if os.path.isdir(TOKENIZER_DIR):
+            os.environ.setdefault("TIKTOKEN_CACHE_DIR", TOKENIZER_DIR)
+        import tiktoken
+        future.set_result(tiktoken.get_encoding(name))
+    except Exception as e:  # no tiktoken, or BPE file neither cached nor downloadable
+        future.set_exception(e)
+
+
+def _encoding(model):
+    """The model's tiktoken encoding, or None while it is unavailable.
+
+    Encodings load on a daemon thread: the first caller waits at most
+    TOKENIZER_TIMEOUT seconds, later callers never wait, and everyone gets
+    the estimate until (unless) the load succeeds.
+    """
+    name = ENCODINGS.get(model, DEFAULT_ENCODING)
+    with _encodings_lock:
+        future = _encodings.get(name)
+        first = future is None
+        if first:
+            future = _encodings[name] = Future()
+            threading.Thread(target=_load_encoding, args=(name, future), daemon=True,
+                             name=f"figuremate-tiktoken-{name}").start()
+    try:
+        return future.result(timeout=TOKENIZER_TIMEOUT if first else 0)
+    except Exception:
+        return None
+
+
+def count_tokens(text, model="gpt-4o"):
+    """Token count for `model` with tiktoken; a script-aware estimate without it."""
+    enc = _encoding(model)
+    if enc is not None:
+        return len(enc.encode(text, disallowed_special=()))
+    # ~4 chars/token for Latin script, ~1 token/char for Hangul and CJK
+    wide = sum(1 for ch in text if ord(ch) > 0x2E7F)
+    return (len(text) - wide + 3) // 4 + wide
+
+
+# ============================================================
+# 2. CHUNKING & BM25 INDEX
+# ============================================================
+
+def _terms(text):
+    return [w for w in _WORD_PAT.findall(text.lower()) if w not in _STOPWORDS and len(w) > 1]
+
+
+def chunk_documents(text, size=CHUNK_CHARS):
+    """Splits merged ingestion text into [{doc, pos, text}] paragraph-aligned chunks."""
+    parts = DOC_HEADER_PAT.split(text)
+    chunks = []
+    for i in range(1, len(parts) - 1, 2):
+        name, body = parts[i], parts[i + 1].strip()
+        refs_at = m.start() if (m := _REFERENCES_PAT.search(body)) else len(body)
+        buf, start = "", 0
+        for para in re.split(r"\n\s*\n", body):
+            if buf and len(buf) + len(para) > size:
+                chunks.append({"doc": name, "pos": len(chunks), "text": buf, "in_refs": start >= refs_at})
+                start += len(buf)
+                buf = ""
+            buf = f"{buf}\n\n{para}" if buf else para
+            while len(buf) > size * 2:  # one huge paragraph (common with PDF text)
+                cut = buf.rfind("\n", size // 2, size)
+                cut = size if cut < 0 else cut
+                chunks.append({"doc": name, "pos": len(chunks), "text": buf[:cut], "in_refs": start >= refs_at})
+                start += cut
+                buf = buf[cut:].lstrip()
+        if buf.strip():
+            chunks.append({"doc": name, "pos": len(chunks), "text": buf, "in_refs": start >= refs_at})
+    return chunks
+
+
+class BM25:
+    """Okapi BM25 over a fixed list of term lists."""
+
+    def __init__(self, docs, k1=1.5, b=0.75):
+        self.k1, self.b = k1, b
+        self.tfs = [Counter(d) for d in docs]
+        self.lens = [len(d) for d in docs]
+        self.avg_len = sum(self.lens) / max(len(docs), 1) or 1.0
+        df = Counter(t for tf in self.tfs for t in tf)
+        n = len(docs)
+        self.idf = {t: math.log(1 + (n - f + 0.5) / (f + 0.5)) for t, f in df.items()}
+
+    def score(self, query, i):
+        tf, norm = self.tfs[i], self.k1 * (1 - self.b + self.b * self.lens[i] / self.avg_len)
+        return sum(
+            self.idf.get(t, 0.0) * weight * tf[t] * (self.k1 + 1) / (tf[t] + norm)
+            for t, weight in query.items() if t in tf
+        )
+
+
+def _is_boilerplate(chunk):
+    if chunk["in_refs"]:
+        return True
+    lines = [l for l in chunk["text"].splitlines() if l.strip()]
+    words = max(len(chunk["text"].split()), 1)
+    citation_density = len(_CITATION_PAT.findall(chunk["text"])) / words
+    short_lines = sum(1 for l in lines if len(l.strip()) < 25) / max(len(lines), 1)
+    return citation_density > 0.08 or short_lines > 0.8
+
+
+def rank_chunks(text, figures):
+    """Scores every chunk by relevance to the corpus' own topic. Returns chunks with a `score`.
+
+    The query is built from figure captions plus each document's opening chunk
+    (title/abstract). Chunks that discuss a captioned figure are boosted;
+    reference lists and header/footer debris are down-weighted.
+    """
+    chunks = chunk_documents(text)
+    if not chunks:
+        return []
+    index = BM25([_terms(c["text"]) for c in chunks])
+
+    query = Counter()
+    for fig in figures.values():
+        query.update(_terms(fig["caption"]))
+    first_seen = set()
+    for c in chunks:
+        if c["doc"] not in first_seen:
+            first_seen.add(c["doc"])
+            query.update(_terms(c["text"]))
+
+    captioned = {}
+    for fig in figures.values():
+        if m := _FIG_REF_PAT.match(fig["caption"]):
+            captioned.setdefault(fig["source"], set()).add(m.group(1))
+
+    top = max(sum(query.values()), 1)
+    query = {t: n / top for t, n in query.items()}
+    for i, c in enumerate(chunks):
+        score = index.score(query, i)
+        refs = sum(1 for n in _FIG_REF_PAT.findall(c["text"]) if n in captioned.get(c["doc"], ()))
+        score *= 1 + FIGURE_BOOST * min(refs, 3)
+        if _is_boilerplate(c):
+            score *= BOILERPLATE_WEIGHT
+        c["score"] = score
+    return chunks
+
+
+# ============================================================
+# 3. BUDGET PACKING
+# ============================================================
+
+def has_text(text):
+    """True if merged ingestion text has content beyond its document headers (scanned PDFs have none)."""
+    return bool(DOC_HEADER_PAT.sub("", text or "").strip())
+
+
+def _assemble(selected):
+    out, last = [], None
+    for c in sorted(selected, key=lambda c: c["pos"]):
+        if last is None or c["doc"] != last["doc"]:
+            out.append(doc_header(c['doc']))
+        elif c["pos"] != last["pos"] + 1:
+            out.append("[...]")
+        out.append(c["text"])
+        last = c
+    return "\n\n".join(out)
+
+
+def select_context(text, figures, model="gpt-4o", budget=None):
+    """Packs the highest-value chunks into a tokenizer-measured budget.
+
+    Each document's opening chunk is kept first, then chunks in score order
+    while they fit. Selected chunks are emitted in source order with `[...]`
+    marking gaps. Returns (context_text, token_count); the count is measured
+    on the final text and never exceeds the budget.
+    """
+    budget = budget or CONTEXT_BUDGETS.get(model, DEFAULT_CONTEXT_BUDGET)
+    chunks = rank_chunks(text, figures)
+    for c in chunks:
+        c["tokens"] = count_tokens(c["text"], model) + 4  # + separators / header share
+
+    openers = {}
+    for c in chunks:
+        openers.setdefault(c["doc"], c)
+    order = list(openers.values()) + sorted(
+        (c for c in chunks if openers[c["doc"]] is not c), key=lambda c: c["score"], reverse=True
+    )
+
+    selected, used = [], 0
+    for c in order:
+        if used + c["tokens"] <= budget:
+            selected.append(c)
+            used += c["tokens"]
+
+    context = _assemble(selected)
+    tokens = count_tokens(context, model)
+    while tokens > budget and selected:
+        # Estimates undershot (headers, BPE merges): drop the weakest chunk and re-measure
+        selected.remove(min(selected, key=lambda c: c["score"]))
+        context = _assemble(selected)
+        tokens = count_tokens(context, model)
+    return context, tokens
@@ -0,0 +1,130 @@
+import base64
+import io
+import zipfile
+from datetime import datetime
+
+from figuremate import trace
+from figuremate.sections import TAG_PAT
+
+# Raw bytes per base64 write; a multiple of 3 so chunks concatenate without padding
+B64_CHUNK = 3 * 16 * 1024
+
+
+# ============================================================
+# 1. REPORT BODY
+# ============================================================
+
+def bytes_to_base64(data, ext="png"):
+    encoded = base64.b64encode(data).decode("utf-8")
+    return f"data:image/{ext.replace('.', '')};base64,{encoded}"
+
+
+def _caption(d):
+    return d['caption'].replace("[", "(").replace("]", ")")
+
+
+def render_body(blog_text, has_hero, figure_registry, link=None):
+    """Report Markdown with [[IMG_XX]] tags resolved.
+
+    By default figures become reference links (`![cap][IMG_1_01]`) whose targets
+    are appended by the writer; `link(img_id, data)` returns an inline target
+    instead (e.g. a relative path inside a ZIP bundle).
+    """
+    lines = []
+    date_str = datetime.now().strftime("%Y-%m-%d")
+    lines.append(f"# Technical Analysis Report\n**Date:** {date_str} | **By:** FigureMate AI\n\n---\n")
+
+    if has_hero:
+        lines.append(f"![Hero Concept]({link('HERO_IMG', None)})\n\n" if link else "![Hero Concept][HERO_IMG]\n\n")
+
+    def _replacer(m):
+        img_id = m.group(1).upper()
+        if img_id in figure_registry:
+            d = figure_registry[img_id]
+            cap = _caption(d)
+            target = f"({link(img_id, d)})" if link else f"[{img_id}]"
+            return f"\n\n![{cap}]{target}\n*{cap} (Source: {d['source']})*\n\n"
+        return ""
+
+    lines.append(TAG_PAT.sub(_replacer, blog_text))
+    if not link:
+        lines.append("\n\n---\n### Asset References\n")
+    return "\n".join(lines)
+
+
+def compile_preview(blog_text, has_hero, figure_registry):
+    """Copy-paste preview: the report body without image data."""
+    return render_body(blog_text, has_hero, figure_registry) + "\n\n(Image data omitted for preview. Download full file below.)"
+
+
+# ============================================================
+# 2. STREAMING WRITERS
+# ============================================================
+
+def _split_data_uri(data_uri):
+    """'data:image/png;base64,....' -> (raw bytes, 'png')."""
+    head, _, payload = data_uri.partition(",")
+    ext = head.split("/")[-1].split(";")[0] or "png"
+    return base64.b64decode(payload), ext
+
+
+def _write_data_uri(out, data, ext):
+    out.write(f"data:image/{ext};base64,")
+    view = memoryview(data)
+    for i in range(0, len(view), B64_CHUNK):
+        out.write(base64.b64encode(view[i:i + B64_CHUNK]).decode("ascii"))
+
+
+def write_markdown_export(out, blog_text, hero_b64, figure_registry):
+    """Writes the single-file export (body + base64 reference targets) to a text stream.
+
+    Figures are encoded chunk by chunk straight into `out`, so no
+    document-sized string is ever built.
+    """
+    out.write(render_body(blog_text, bool(hero_b64), figure_registry))
+    if hero_b64:
+        out.write(f"\n[HERO_IMG]: {hero_b64}")
+    for img_id, data in figure_registry.items():
+        out.write(f"\n[{img_id}]: ")
+        _write_data_uri(out, data['bytes'], data['ext'])
+
+
+def write_zip_export(out, blog_text, hero_b64, figure_registry):
+    """Writes a ZIP bundle (report.md + figures/*) to a binary stream."""
+    def link(img_id, d):
+        ext = d['ext'] if d else hero_ext
+        return f"figures/{img_id}.{ext}"
+
+    hero_bytes, hero_ext = _split_data_uri(hero_b64) if hero_b64 else (None, None)
+    with zipfile.ZipFile(out, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("report.md", render_body(blog_text, bool(hero_b64), figure_registry, link))
+        if hero_bytes:
+            zf.writestr(link("HERO_IMG", None), hero_bytes, compress_type=zipfile.ZIP_STORED)
+        for img_id, data in figure_registry.items():
+            # PNG/JPEG/WebP are already compressed; deflating them again only costs CPU
+            zf.writestr(link(img_id, data), data['bytes'], compress_type=zipfile.ZIP_STORED)
+
+
+def export_file(kind, blog_text, hero_b64, figure_registry):
+    """Builds an export on demand (download time) into a rewound binary buffer.
+
+    kind: "md" (single file, inline base64) or "zip" (report.md + figure files).
+    """
+    buf = io.BytesIO()
+    with trace.span(f"export.{kind}", figures=len(figure_registry)) as attrs:
+        if kind == "zip":
+            write_zip_export(buf, blog_text, hero_b64, figure_registry)
+        else:
+            text = io.TextIOWrapper(buf, encoding="utf-8", write_through=True)
+            write_markdown_export(text, blog_text, hero_b64, figure_registry)
+            text.detach()
+        attrs["bytes"] = buf.tell()
+    buf.seek(0)
+    return buf
+
+
+def compile_markdown_export(blog_text, hero_b64, figure_registry):
+    """Returns (preview_md, download_md) as strings (for callers that need both in memory)."""
+    buf = io.StringIO()
+    write_markdown_export(buf, blog_text, hero_b64, figure_registry)
+    return compile_preview(blog_text, bool(hero_b64), figure_registry), buf.getvalue()
@@ -0,0 +1,80 @@
+"""Downloads the web fonts of the page CSS into static/fonts (a build step).
+
+    python -m figuremate.fonts
+    python -m figuremate.fonts --mirror https://npm-mirror.example.com --check
+
+Run it wherever the internet (or a mirror of jsDelivr's npm endpoint) is
+reachable, e.g. right after `pip install` in the image build; the app then
+serves the fonts itself and air-gapped pods never need a font CDN. Versions
+are pinned, every file is checked to be a WOFF2 font, and the SIL OFL license
+of each family is saved next to its files. `--check` only verifies that all
+files are present (exit code 1 if not).
+"""
+import argparse
+import os
+import sys
+import urllib.request
+
+from figuremate.theme import STATIC_DIR
+
+FONTS_DIR = os.path.join(STATIC_DIR, "fonts")
+DEFAULT_MIRROR = "https://cdn.jsdelivr.net/npm"
+PRETENDARD = "pretendard@1.3.9"
+INTER = "@fontsource/inter@5.0.18"
+
+# local file -> path below the npm mirror; the weights the CSS uses (400/500/600/700)
+FONT_FILES = {
+    **{f"Pretendard-{w}.woff2": f"{PRETENDARD}/dist/web/static/woff2/Pretendard-{w}.woff2"
+       for w in ("Regular", "Medium", "SemiBold", "Bold")},
+    **{f"Inter-{w}.woff2": f"{INTER}/files/inter-latin-{n}-normal.woff2"
+       for w, n in (("Regular", 400), ("Medium", 500), ("SemiBold", 600), ("Bold", 700))},
+    "LICENSE-Pretendard.txt": f"{PRETENDARD}/LICENSE",
+    "LICENSE-Inter.txt": f"{INTER}/LICENSE",
+}
+TIMEOUT = 30
+
+
+def missing_fonts(fonts_dir=FONTS_DIR):
+    """Names of FONT_FILES not present in `fonts_dir`."""
+    return [name for name in FONT_FILES if not os.path.isfile(os.path.join(fonts_dir, name))]
+
+
+def fetch_fonts(fonts_dir=FONTS_DIR, mirror=DEFAULT_MIRROR, force=False):
+    """Downloads FONT_FILES into `fonts_dir` (skipping present ones unless `force`). Returns the names fetched."""
+    os.makedirs(fonts_dir, exist_ok=True)
+    fetched = []
+    for name, path in FONT_FILES.items():
+        dest = os.path.join(fonts_dir, name)
+        if os.path.isfile(dest) and not force:
+            continue
+        with urllib.request.urlopen(f"{mirror.rstrip('/')}/{path}", timeout=TIMEOUT) as resp:
+            data = resp.read()
+        if name.endswith(".woff2") and not data.startswith(b"wOF2"):
+            raise ValueError(f"{name}: not a WOFF2 font ({len(data)} bytes from {path})")
+        tmp = f"{dest}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, dest)
+        fetched.append(name)
+    return fetched
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dest", default=FONTS_DIR)
+    parser.add_argument("--mirror", default=os.environ.get("FIGUREMATE_FONT_MIRROR", DEFAULT_MIRROR))
+    parser.add_argument("--force", action="store_true", help="download again even if present")
+    parser.add_argument("--check", action="store_true", help="only verify that every file is present")
+    args = parser.parse_args()
+    if not args.check:
+        for name in fetch_fonts(args.dest, args.mirror, args.force):
+            print(f"fetched {name}")
+    missing = missing_fonts(args.dest)
+    if missing:
+        print(f"missing in {args.dest}: {', '.join(missing)}", file=sys.stderr)
+        sys.exit(1)
+    print(f"all {len(FONT_FILES)} font files present in {args.dest}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,538 @@
+import io
+import os
+import re
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from itertools import repeat
+from multiprocessing import get_context
+
+import fitz  # PyMuPDF
+
+from figuremate.assets import PHOTO_FORMAT, PHOTO_QUALITY, choose_dpi, encode_figure
+from figuremate import trace
+from figuremate.cache import content_digest, default_cache, file_digest
+from figuremate.sections import doc_header
+
+# Worker processes used to parse PDFs in parallel (1 = parse inline). The pool
+# lives as long as the process: a spawned worker re-imports PyMuPDF and Pillow,
+# which costs more than parsing a typical PDF. Batches of misses smaller than
+# POOL_MIN_MB in total are parsed inline all the same.
+DEFAULT_INGEST_WORKERS = int(os.environ.get("FIGUREMATE_INGEST_WORKERS", os.cpu_count() or 1))
+POOL_MIN_MB = float(os.environ.get("FIGUREMATE_POOL_MIN_MB", "8"))
+
+# "embedded": copy embedded raster images by xref, rasterize only vector figures.
+# "render": always rasterize the region above each caption (legacy behaviour).
+FIGURE_MODE = os.environ.get("FIGUREMATE_FIGURE_MODE", "embedded")
+
+# Region rasterized for a figure without an embedded image.
+# "layout": tight union of the image/drawing boxes next to the caption, within its column.
+# "fixed": the 450pt box above the caption (legacy behaviour).
+REGION_MODE = os.environ.get("FIGUREMATE_FIGURE_REGION", "layout")
+REGION_REACH = 450    # pt: furthest a figure may extend from its caption
+REGION_NEAR = 72      # pt: max gap between a caption and the nearest edge of its figure
+REGION_GAP = 14       # pt: graphics closer than this belong to the same figure
+REGION_PAD = 4
+
+MAX_DOC_CHARS = 15000
+
+# Large documents. Pages are read in order and released one at a time; reading
+# stops early once the text budget is full and the figure cap is reached.
+# 0 = unlimited.
+MAX_PAGES = int(os.environ.get("FIGUREMATE_MAX_PAGES", "0"))
+MAX_FIGURES_PER_DOC = int(os.environ.get("FIGUREMATE_MAX_FIGURES", "0"))
+LARGE_DOC_PAGES = 300     # documents longer than this get LARGE_DOC_FIGURES as cap unless one is set
+LARGE_DOC_FIGURES = 60
+# Text budget (chars) of a large document read with max_chars=None (full-text /
+# map-reduce mode); without it reading could never stop early. 0 = no budget.
+LARGE_DOC_CHARS = int(os.environ.get("FIGUREMATE_LARGE_DOC_CHARS", "400000"))
+# Growth of resident memory (MB) while parsing one document above which figure
+# extraction stops (text continues). Measured from the start of the parse, so
+# a server process already holding other sessions is not penalized.
+# Linux only; 0 = no guard.
+MAX_INGEST_MB = int(os.environ.get("FIGUREMATE_INGEST_MAX_MB", "2048"))
+SPOOL_DIR = os.environ.get("FIGUREMATE_SPOOL_DIR") or None  # None = system temp dir
+SPOOL_CHUNK = 1 << 20
+
+CAPTION_PAT = re.compile(r"^(Figure|Fig)(\.|)\s*\d+", re.IGNORECASE)
+
+
+# ============================================================
+# 1. UTILITY FUNCTIONS
+# ============================================================
+
+class NamedBytesIO(io.BytesIO):
+    """In-memory stand-in for a Streamlit UploadedFile (for the batch CLI and benchmarks)."""
+
+    def __init__(self, data, name):
+        super().__init__(data)
+        self.name = name
+
+
+def _rss_mb():
+    """Current resident set size of this process in MB, or None where /proc is unavailable."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _spool(uploaded_file):
+    """Copies an upload to a temp file in chunks. Returns its path."""
+    uploaded_file.seek(0)
+    with tempfile.NamedTemporaryFile("wb", suffix=".pdf", dir=SPOOL_DIR, delete=False) as f:
+        shutil.copyfileobj(uploaded_file, f, SPOOL_CHUNK)
+    return f.name
+
+
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+def _parse_pool(workers):
+    """Process-wide parse pool with at least `workers` processes, started on first use."""
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers < workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            # spawn: forking a threaded Streamlit server is not safe
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn"))
+            _pool_workers = workers
+        return _pool
+
+
+def _reset_pool(pool):
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False)
+
+
+# ============================================================
+# 2. PDF INGESTION ENGINE
+# ============================================================
+
+def _column(page, caption_rect):
+    """(x0, x1) of the column a caption sits in: a page half in two-column layouts, else the full width."""
+    pr = page.rect
+    mid = (pr.x0 + pr.x1) / 2
+    if caption_rect.x1 <= mid + 10:
+        return pr.x0, mid
+    if caption_rect.x0 >= mid - 10:
+        return mid, pr.x1
+    return pr.x0, pr.x1
+
+
+def _page_graphics(page):
+    """Bounding boxes of the images and vector drawings on a page.
+
+    Hairlines (axes, rules) get a minimal thickness; page-sized backgrounds are dropped.
+    """
+    pr = page.rect
+    boxes = [fitz.Rect(i["bbox"]) for i in page.get_image_info()]
+    boxes += [fitz.Rect(d["rect"]) for d in page.get_drawings()]
+    graphics = []
+    for box in boxes:
+        box = fitz.Rect(box.x0, box.y0, max(box.x1, box.x0 + 1), max(box.y1, box.y0 + 1)) & pr
+        if box.is_empty or box.get_area() > 0.8 * pr.get_area():
+            continue
+        graphics.append(box)
+    return graphics
+
+
+def _overlaps(rect, taken, share=0.5):
+    """True if `rect` shares more than `share` of its (or the other's) area with a taken region."""
+    for other in taken:
+        inter = rect & other
+        if not inter.is_empty and inter.get_area() > share * min(rect.get_area(), other.get_area()):
+            return True
+    return False
+
+
+def _figure_region(page, caption_rect, graphics, blocks, taken):
+    """Tight region of the figure a caption belongs to, or None when no graphics are near it.
+
+    The graphic nearest to the caption (above it, else below, else beside it;
+    within REGION_NEAR) seeds the region, which grows by every graphic within
+    REGION_GAP of it and then takes in the short text blocks it overlaps
+    (axis labels, legends). Graphics already inside a taken region are ignored.
+    """
+    x0, x1 = _column(page, caption_rect)
+    free = [g for g in graphics if not _overlaps(g, taken)]
+    in_column = [g for g in free if g.x1 > x0 and g.x0 < x1]
+    sides = (
+        ([g for g in in_column if g.y1 <= caption_rect.y0 + 2 and g.y0 >= caption_rect.y0 - REGION_REACH],
+         lambda g: caption_rect.y0 - g.y1),
+        ([g for g in in_column if g.y0 >= caption_rect.y1 - 2 and g.y1 <= caption_rect.y1 + REGION_REACH],
+         lambda g: g.y0 - caption_rect.y1),
+        ([g for g in free if g.y0 < caption_rect.y1 and g.y1 > caption_rect.y0
+          and (g.x1 <= caption_rect.x0 or g.x0 >= caption_rect.x1)],
+         lambda g: max(caption_rect.x0 - g.x1, g.x0 - caption_rect.x1)),
+    )
+    for group, distance in sides:
+        if not group:
+            continue
+        seed = min(group, key=distance)
+        if distance(seed) > REGION_NEAR:
+            continue
+        region = fitz.Rect(seed)
+        grown = True
+        while grown:
+            near = fitz.Rect(region.x0 - REGION_GAP, region.y0 - REGION_GAP, region.x1 + REGION_GAP, region.y1 + REGION_GAP)
+            grown = False
+            for g in group:
+                if g.intersects(near) and g not in region:
+                    region |= g
+                    grown = True
+        for b in blocks:
+            rect = fitz.Rect(b[:4])
+            inter = rect & region
+            if len(b[4]) < 80 and not CAPTION_PAT.match(b[4].strip()) and not inter.is_empty \
+                    and inter.get_area() >= 0.5 * rect.get_area():
+                region |= rect
+        region = fitz.Rect(region.x0 - REGION_PAD, region.y0 - REGION_PAD,
+                           region.x1 + REGION_PAD, region.y1 + REGION_PAD) & page.rect
+        if caption_rect.y0 >= region.y1 - REGION_PAD - 2:
+            region.y1 = min(region.y1, caption_rect.y0)  # never include the caption itself
+        elif caption_rect.y1 <= region.y0 + REGION_PAD + 2:
+            region.y0 = max(region.y0, caption_rect.y1)
+        if region.width >= 30 and region.height >= 30:
+            return region
+    return None
+
+
+def _fixed_roi(page, caption_rect, layout=False):
+    """The region above a caption used when no graphics are found (column-wide in layout mode)."""
+    pr = page.rect
+    x0, x1 = _column(page, caption_rect) if layout else (pr.x0, pr.x1)
+    return fitz.Rect(x0 + 30 if x0 == pr.x0 else x0, max(0, caption_rect.y0 - REGION_REACH),
+                     x1 - 30 if x1 == pr.x1 else x1, caption_rect.y0)
+
+
+def _render_roi(page, caption_rect, graphics, blocks, taken, attrs):
+    """Rasterizes the figure region of a caption. Returns an encoded figure or None.
+
+    Regions overlapping one already taken on the page (a figure claimed by a
+    nearby caption) are skipped. The rendered pixel count goes to `attrs`.
+    """
+    roi = None
+    if REGION_MODE == "layout":
+        roi = _figure_region(page, caption_rect, graphics, blocks, taken) or _fixed_roi(page, caption_rect, True)
+        if _overlaps(roi, taken):
+            attrs["method"] = "overlap"
+            return None
+    else:
+        roi = _fixed_roi(page, caption_rect)
+    taken.append(roi)
+    pix = page.get_pixmap(clip=roi, dpi=choose_dpi(roi))
+    attrs["pixels"] = pix.width * pix.height
+    if pix.width > 100 and pix.height > 100:
+        return encode_figure(pix)
+    return None
+
+
+def _extract_xref(doc, info):
+    """Pulls an embedded image out of the PDF without re-rendering. Returns an encoded figure."""
+    xref = info["xref"]
+    img = doc.extract_image(xref)
+    pix = fitz.Pixmap(doc, xref)
+    if img.get("smask"):
+        pix = fitz.Pixmap(pix, fitz.Pixmap(doc, img["smask"]))
+    original = None
+    if img["ext"] in ("png", "jpeg") and not img.get("smask") and img.get("colorspace", 3) in (1, 3):
+        original = (img["image"], img["ext"])
+    return encode_figure(pix, original)
+
+
+def _nearest_image(caption_rect, images, taken):
+    """Picks the embedded image closest to a caption (above preferred, within 450pt)."""
+    best, best_dist = None, 450
+    for info in images:
+        rect = fitz.Rect(info["bbox"])
+        if info["xref"] in taken or rect.x1 < caption_rect.x0 or rect.x0 > caption_rect.x1:
+            continue
+        if rect.y1 <= caption_rect.y0 + 5:
+            dist = caption_rect.y0 - rect.y1
+        else:
+            dist = rect.y0 - caption_rect.y1 + 50  # below the caption: tables, some layouts
+        if 0 <= dist < best_dist:
+            best, best_dist = info, dist
+    return best
+
+
+def _extract_figures(doc, page, page_num, blocks, mode, seen_xrefs, limit=None):
+    """Extracts one figure per caption block on a page (at most `limit`).
+
+    In "embedded" mode the caption is matched to the nearest embedded raster
+    image, which is copied out by xref (each xref at most once per document);
+    the caption's figure region (see REGION_MODE) is rasterized only when no
+    image matches, i.e. for vector figures. "render" mode always rasterizes it.
+    """
+    figures = []
+    images = None
+    graphics = None
+    taken = set()
+    regions = []  # page areas already claimed by a figure
+    for block in blocks:
+        if limit is not None and len(figures) >= limit:
+            break
+        text = block[4].strip()
+        if not CAPTION_PAT.match(text):
+            continue
+        caption_rect = fitz.Rect(block[:4])
+        with trace.span("ingest.figure", page=page_num + 1) as attrs:
+            try:
+                info = None
+                if mode == "embedded":
+                    if images is None:
+                        images = [i for i in page.get_image_info(xrefs=True)
+                                  if i["xref"] > 0 and i["width"] > 100 and i["height"] > 100]
+                    info = _nearest_image(caption_rect, images, taken)
+                if info is not None:
+                    taken.add(info["xref"])
+                    regions.append(fitz.Rect(info["bbox"]))
+                    if info["xref"] in seen_xrefs:
+                        attrs["method"] = "duplicate"
+                        continue
+                    seen_xrefs.add(info["xref"])
+                    attrs["method"] = "xref"
+                    img = _extract_xref(doc, info)
+                else:
+                    attrs["method"] = "render"
+                    if graphics is None and REGION_MODE == "layout":
+                        graphics = _page_graphics(page)
+                    img = _render_roi(page, caption_rect, graphics, blocks, regions, attrs)
+                if img:
+                    attrs["bytes"] = len(img["bytes"])
+                    figures.append({
+                        "page": page_num + 1,
+                        "caption": text,
+                        **img,
+                        "digest": content_digest(img["bytes"]),
+                    })
+            except Exception:
+                attrs["error"] = True
+    return figures
+
+
+def parse_document(source, mode=None, max_chars=MAX_DOC_CHARS, page_range=None, max_figures=None,
+                   max_mb=MAX_INGEST_MB):
+    """Parses one PDF (a file path or bytes). Returns (text, figures) with figures in page order.
+
+    Single pass: each page is loaded once and its text blocks extracted once;
+    the truncated document text and the caption candidates both come from
+    those blocks, and the page is released before the next one is loaded.
+
+    `page_range` is a 1-based inclusive (first, last) pair; last=None reads to
+    the end, and a range past the end gives empty text and no figures.
+    `max_figures` caps figures per document (None: LARGE_DOC_FIGURES for
+    documents over LARGE_DOC_PAGES pages, else no cap; 0: no cap), and
+    `max_chars=None` means LARGE_DOC_CHARS for those documents. Reading
+    stops as soon as the text budget is full and the cap is reached. Once
+    resident memory has grown by `max_mb` since the parse started figure
+    extraction stops; an "ingest.stop" record on the current trace gives the
+    reason.
+
+    The result depends only on the bytes (no file name, no IMG IDs), so it can
+    be cached by content hash. Runs inside worker processes, so it only takes
+    and returns picklable data.
+    """
+    mode = mode or FIGURE_MODE
+    base_mb = _rss_mb() if max_mb else None
+    doc = fitz.open(source) if isinstance(source, str) else fitz.open(stream=source, filetype="pdf")
+    chunks = []
+    figures = []
+    seen_xrefs = set()
+    total_chars = 0
+    truncated = False
+    try:
+        first, last = page_range or (1, None)
+        first, last = max(first, 1), min(last or doc.page_count, doc.page_count)
+        large = doc.page_count > LARGE_DOC_PAGES
+        if max_figures is None:
+            max_figures = LARGE_DOC_FIGURES if large else 0
+        if max_chars is None and large:
+            max_chars = LARGE_DOC_CHARS or None
+        max_figures = max_figures or None
+        figures_done = False
+        for page_num in range(first - 1, last):
+            if max_figures is not None and len(figures) >= max_figures:
+                figures_done = True
+            if figures_done and truncated:
+                trace.record_span("ingest.stop", 0.0, reason="budget", page=page_num + 1)
+                break
+            page = doc.load_page(page_num)
+            blocks = [b for b in page.get_text("blocks") if b[6] == 0]
+
+            # Text (truncated)
+            if not truncated:
+                text = "".join(b[4] for b in blocks)
+                if max_chars is not None and total_chars + len(text) > max_chars:
+                    chunks.append(text[:max_chars - total_chars] + "\n...(Truncated)...")
+                    truncated = True
+                else:
+                    chunks.append(text)
+                    total_chars += len(text)
+
+            # Figures
+            if not figures_done:
+                limit = max_figures - len(figures) if max_figures is not None else None
+                figures.extend(_extract_figures(doc, page, page_num, blocks, mode, seen_xrefs, limit))
+            del page, blocks
+            if large:
+                # MuPDF caches decoded page resources (up to 256 MB). Emptying it costs
+                # re-decoding shared fonts per page, so only long documents pay that.
+                fitz.TOOLS.store_shrink(100)
+
+            # Memory guard: past the limit keep reading text but stop rasterizing
+            if base_mb is not None and not figures_done and (_rss_mb() or 0) - base_mb > max_mb:
+                figures_done = True
+                trace.record_span("ingest.stop", 0.0, reason="memory", page=page_num + 1)
+        if first <= last and (first, last) != (1, doc.page_count) and not truncated:
+            chunks.append(f"...(Pages {first}-{last} of {doc.page_count})...")
+    finally:
+        doc.close()
+    return "\n".join(chunks), figures
+
+
+def _parse_document_safe(source, mode, max_chars, page_range, max_figures):
+    """parse_document for pool workers. Returns (result or None, trace records)."""
+    size = os.path.getsize(source) if isinstance(source, str) else len(source)
+    local = trace.Trace(log=False)  # worker processes have no trace; the parent replays these
+    with trace.use_trace(local), trace.span("ingest.parse", bytes=size) as attrs:
+        try:
+            result = parse_document(source, mode, max_chars, page_range, max_figures)
+            attrs["figures"] = len(result[1])
+        except Exception:
+            result = None
+            attrs["error"] = True
+    return result, local.records
+
+
+def extract_text_and_figures(files, workers=None, cache=None, mode=None, max_doc_chars=MAX_DOC_CHARS,
+                             page_range=None, max_figures=None, state=None, digests=None):
+    """Parses any number of PDFs (the caller caps uploads). Filters images >100px.
+
+    `files` are uploads (file objects with a name) or paths. Uploads are
+    spooled to temp files in chunks and every document is opened from disk,
+    so neither this process nor the parse workers hold whole PDFs in memory.
+    `max_doc_chars` truncates each document's text (MAX_DOC_CHARS by
+    default). The app passes None to keep the full text (up to
+    LARGE_DOC_CHARS for large documents) and leaves the per-document budget
+    to figuremate.context, which packs each model's token budget.
+    `page_range` and `max_figures` default to FIGUREMATE_MAX_PAGES and
+    FIGUREMATE_MAX_FIGURES (see parse_document).
+    Documents are looked up in `cache` (None = shared default, False = bypass)
+    by figure and region mode, limits, encoding and SHA-256 of their bytes; only
+    misses are parsed. With workers > 1 misses totalling POOL_MIN_MB or more
+    are parsed in the process-wide worker pool. Results are merged in upload
+    order. An image seen before (same bytes, any page or document) is
+    registered once.
+
+    Figure IDs are namespaced per document: IMG_<doc>_<nn>, where <doc> is the
+    document's number in the set and <nn> the figure's place in it, so an ID
+    never depends on the other documents. `state` is a dict the caller keeps
+    between calls (e.g. in session state) to make re-ingestion incremental:
+    documents parsed by an earlier call with the same options are reused
+    as-is, and a document keeps its number for as long as the state lives,
+    so tags in an existing report stay valid when files are added or removed.
+    `digests` (SHA-256 per file, in order) saves hashing files the caller has
+    already hashed.
+    """
+    workers = DEFAULT_INGEST_WORKERS if workers is None else workers
+    mode = mode or FIGURE_MODE
+    cache = default_cache() if cache is None else cache or None
+    page_range = page_range or (1, MAX_PAGES or None)
+    max_figures = (MAX_FIGURES_PER_DOC or None) if max_figures is None else max_figures
+
+    spooled = []
+    try:
+        with trace.span("ingest", docs=len(files), workers=workers) as attrs:
+            full_text, figure_registry = _extract(files, workers, cache, mode, max_doc_chars, page_range,
+                                                  max_figures, {} if state is None else state, digests, spooled, attrs)
+    finally:
+        for path in spooled:
+            os.unlink(path)
+    return full_text, figure_registry, len(full_text) // 4
+
+
+def _extract(files, workers, cache, mode, max_doc_chars, page_range, max_figures, state, known_digests, spooled,
+             attrs):
+    limits = f"p{page_range[0]}-{page_range[1] or 'end'}-f{'auto' if max_figures is None else max_figures}"
+    known = state.get("docs", {})         # key -> (text, figures) from the previous call
+    slots = state.setdefault("slots", {})  # content digest -> document number, never reused
+    names, digests, keys, results, misses = [], [], [], [], {}
+    for i, source in enumerate(files):
+        name = os.path.basename(source) if isinstance(source, str) else source.name
+        digest = known_digests[i] if known_digests else file_digest(source)
+        key = f"{mode}-{REGION_MODE}-{max_doc_chars or f'full{LARGE_DOC_CHARS}'}-{limits}-{PHOTO_FORMAT}{PHOTO_QUALITY}-{digest}"
+        names.append(name)
+        digests.append(digest)
+        keys.append(key)
+        if key in known:
+            results.append(known[key])
+            trace.record_span("ingest.reused", 0.0, doc=name)
+            continue
+        results.append(cache.get(key) if cache else None)
+        if results[-1] is not None:
+            trace.record_span("ingest.cache_hit", 0.0, doc=name)
+        elif key not in misses:
+            if isinstance(source, str):
+                misses[key] = source
+            else:
+                misses[key] = _spool(source)
+                spooled.append(misses[key])
+    attrs["cache_misses"] = len(misses)
+
+    if misses:
+        parsed = None
+        size_mb = sum(os.path.getsize(path) for path in misses.values()) / 2**20
+        if workers > 1 and len(misses) > 1 and size_mb >= POOL_MIN_MB:
+            pool = _parse_pool(workers)
+            try:
+                parsed = dict(zip(misses, pool.map(_parse_document_safe, misses.values(), repeat(mode),
+                                                   repeat(max_doc_chars), repeat(page_range), repeat(max_figures))))
+            except BrokenProcessPool:
+                _reset_pool(pool)  # a worker died (e.g. OOM-killed): parse inline, restart the pool next time
+            attrs["pool"] = parsed is not None
+        if parsed is None:
+            parsed = {key: _parse_document_safe(path, mode, max_doc_chars, page_range, max_figures)
+                      for key, path in misses.items()}
+        doc_names = dict(zip(reversed(keys), reversed(names)))  # first upload of each key
+        for key, (result, records) in list(parsed.items()):
+            trace.replay(records, doc=doc_names[key])
+            parsed[key] = result
+            stopped_on_memory = any(r.get("reason") == "memory" for r in records)  # depends on load, not content
+            if cache and result is not None and not stopped_on_memory:
+                cache.put(key, *result)
+        results = [parsed[k] if r is None else r for k, r in zip(keys, results)]
+
+    state["docs"] = {k: r for k, r in zip(keys, results) if r is not None}
+
+    merged_text = []
+    figure_registry = {}
+    registered = set()
+    for name, digest, result in zip(names, digests, results):
+        if result is None:
+            continue
+        text, figures = result
+        doc_no = slots.setdefault(digest, len(slots) + 1)
+        merged_text.append(f"{doc_header(name)}\n{text}")
+        for fig_no, fig in enumerate(figures, 1):
+            if fig["digest"] in registered:
+                continue
+            registered.add(fig["digest"])
+            img_id = f"IMG_{doc_no}_{fig_no:02d}"
+            figure_registry[img_id] = {
+                "id": img_id,
+                "source": name,
+                **fig,
+            }
+
+    return "\n\n".join(merged_text), figure_registry
@@ -0,0 +1,173 @@
+import contextvars
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+
+# Pipelines running at once across all sessions; the rest wait in a fair queue.
+MAX_CONCURRENT_JOBS = int(os.environ.get("FIGUREMATE_JOB_WORKERS", "4"))
+MAX_QUEUED_JOBS = int(os.environ.get("FIGUREMATE_JOB_QUEUE", "32"))
+JOB_TTL = 3600  # seconds a finished job stays available for reattaching
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+
+
+class JobCancelled(Exception):
+    """Raised inside a job body by `set_stage`/`append` once the job is cancelled."""
+
+
+# ============================================================
+# 1. JOB HANDLE
+# ============================================================
+
+class Job:
+    """One background run. The body reports progress through `set_stage` and
+    `append`; readers take a consistent copy with `snapshot`."""
+
+    def __init__(self, owner, fn, args, kwargs):
+        self.id = uuid.uuid4().hex[:12]
+        self.owner = owner
+        self.status = QUEUED
+        self.stages = []        # stage names, in the order they started
+        self.draft = ""         # partial output, e.g. the streaming report
+        self.result = None
+        self.error = None
+        self.finished = None
+        self.context = {}       # read-only extras the submitter attaches for readers
+        self._call = (fn, args, kwargs)
+        self._context = contextvars.copy_context()  # the submitter's context (e.g. its trace)
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+
+    def _check(self):
+        if self._cancel.is_set():
+            raise JobCancelled(self.id)
+
+    def set_stage(self, name):
+        self._check()
+        with self._lock:
+            self.stages.append(name)
+
+    def append(self, text):
+        self._check()
+        with self._lock:
+            self.draft += text
+
+    @property
+    def active(self):
+        return self.status in (QUEUED, RUNNING)
+
+    def snapshot(self):
+        with self._lock:
+            return {"id": self.id, "status": self.status, "stages": list(self.stages),
+                    "draft": self.draft, "result": self.result, "error": self.error}
+
+
+# ============================================================
+# 2. BOUNDED, FAIR EXECUTOR
+# ============================================================
+
+class JobManager:
+    """Fixed pool of worker threads fed from per-owner FIFO queues.
+
+    Owners are served round-robin, so one session queueing several jobs cannot
+    starve the others. `submit` refuses work (returns None) once `max_queued`
+    jobs are waiting. Finished jobs are kept for `ttl` seconds so a reloaded
+    page can reattach by job ID.
+    """
+
+    def __init__(self, workers=MAX_CONCURRENT_JOBS, max_queued=MAX_QUEUED_JOBS, ttl=JOB_TTL):
+        self.max_queued = max_queued
+        self.ttl = ttl
+        self._jobs = {}
+        self._queues = OrderedDict()  # owner -> deque of jobs; owners rotate to the back when served
+        self._cond = threading.Condition()
+        for i in range(workers):
+            threading.Thread(target=self._worker, name=f"figuremate-job-{i}", daemon=True).start()
+
+    def submit(self, owner, fn, *args, **kwargs):
+        """Queues `fn(job, *args, **kwargs)`. Returns the Job, or None if the queue is full."""
+        with self._cond:
+            self._prune()
+            if sum(len(q) for q in self._queues.values()) >= self.max_queued:
+                return None
+            job = Job(owner, fn, args, kwargs)
+            self._jobs[job.id] = job
+            self._queues.setdefault(owner, deque()).append(job)
+            self._cond.notify()
+            return job
+
+    def get(self, job_id):
+        with self._cond:
+            return self._jobs.get(job_id)
+
+    def position(self, job):
+        """1-based place of a queued job in the round-robin service order (0 if not queued)."""
+        with self._cond:
+            queues = [list(q) for q in self._queues.values()]
+        order = []
+        for depth in range(max(map(len, queues), default=0)):
+            order.extend(q[depth] for q in queues if depth < len(q))
+        return order.index(job) + 1 if job in order else 0
+
+    def cancel(self, job_id):
+        """Drops a queued job, or asks a running one to stop at its next progress report."""
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None or not job.active:
+                return
+            job._cancel.set()
+            queue = self._queues.get(job.owner)
+            if queue and job in queue:
+                queue.remove(job)
+                if not queue:
+                    del self._queues[job.owner]
+                self._finish(job, CANCELLED)
+
+    def _finish(self, job, status, result=None, error=None):
+        with job._lock:
+            job.status, job.result, job.error = status, result, error
+            job.finished = time.monotonic()
+
+    def _prune(self):
+        now = time.monotonic()
+        for job_id in [j.id for j in self._jobs.values() if j.finished and now - j.finished > self.ttl]:
+            del self._jobs[job_id]
+
+    def _next(self):
+        owner, queue = next(iter(self._queues.items()))
+        job = queue.popleft()
+        del self._queues[owner]
+        if queue:
+            self._queues[owner] = queue  # re-inserted at the back: next owner goes first
+        return job
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._queues:
+                    self._cond.wait()
+                job = self._next()
+                with job._lock:
+                    job.status = RUNNING
+            fn, args, kwargs = job._call
+            try:
+                self._finish(job, DONE, result=job._context.run(fn, job, *args, **kwargs))
+            except JobCancelled:
+                self._finish(job, CANCELLED)
+            except Exception as e:
+                self._finish(job, FAILED, error=f"{type(e).__name__}: {e}")
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def default_manager():
+    """Process-wide JobManager shared by every Streamlit session."""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = JobManager()
+        return _manager
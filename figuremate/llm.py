@@ -0,0 +1,326 @@
+import asyncio
+import contextvars
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from figuremate import cache, trace
+from figuremate.context import count_tokens
+
+# Per-request timeouts (seconds). Long generations stream, so the read timeout is generous.
+REQUEST_TIMEOUT = float(os.environ.get("FIGUREMATE_OPENAI_TIMEOUT", "120"))
+CONNECT_TIMEOUT = 10.0
+
+MAX_RETRIES = int(os.environ.get("FIGUREMATE_OPENAI_RETRIES", "4"))
+BACKOFF_BASE = 1.0   # seconds; doubled per attempt, with jitter
+BACKOFF_CAP = 30.0
+
+# (requests/min, tokens/min) per model, shared by every session in this process.
+# tokens/min is None for endpoints billed per request (images).
+RATE_LIMITS = {
+    "gpt-4o": (500, 450_000),
+    "gpt-4o-mini": (500, 2_000_000),
+    "dall-e-3": (5, None),
+}
+DEFAULT_RATE_LIMIT = (500, 450_000)
+DEFAULT_OUTPUT_TOKENS = 2000  # reserved per chat call when max_tokens is not given
+
+
+class ReplayMiss(RuntimeError):
+    """Replay mode has no recorded response for a request (see figuremate.cache)."""
+
+
+# ============================================================
+# 1. RATE LIMITER (token buckets)
+# ============================================================
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute token buckets for one model.
+
+    `acquire` blocks until both buckets can cover the request. A request larger
+    than the whole TPM bucket waits for a full bucket instead of forever.
+    `settle` corrects the token bucket once the real usage is known (0 for a
+    failed attempt, which refunds the whole reservation).
+    """
+
+    def __init__(self, rpm, tpm=None):
+        self.rpm, self.tpm = rpm, tpm
+        self._requests = float(rpm)
+        self._tokens = float(tpm or 0)
+        self._updated = time.monotonic()
+        self._cond = threading.Condition()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed, self._updated = now - self._updated, now
+        self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60)
+        if self.tpm:
+            self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60)
+
+    def acquire(self, tokens=0):
+        """Blocks until a request of `tokens` may be sent. Returns seconds waited."""
+        start = time.monotonic()
+        with self._cond:
+            while True:
+                self._refill()
+                need = min(tokens, self.tpm) if self.tpm else 0
+                if self._requests >= 1 and self._tokens >= need:
+                    self._requests -= 1
+                    self._tokens -= need
+                    return time.monotonic() - start
+                wait = (1 - self._requests) * 60 / self.rpm if self._requests < 1 else 0
+                if self.tpm and self._tokens < need:
+                    wait = max(wait, (need - self._tokens) * 60 / self.tpm)
+                self._cond.wait(max(wait, 0.01))
+
+    def settle(self, reserved, used):
+        """Refunds (or charges) the difference between reserved and actual tokens."""
+        if not self.tpm:
+            return
+        with self._cond:
+            self._tokens = min(self.tpm, self._tokens + reserved - used)
+            self._cond.notify_all()
+
+
+_limiters = {}
+_clients = {}
+_lock = threading.Lock()
+
+
+def get_limiter(model):
+    with _lock:
+        if model not in _limiters:
+            _limiters[model] = RateLimiter(*RATE_LIMITS.get(model, DEFAULT_RATE_LIMIT))
+        return _limiters[model]
+
+
+def configure_rate_limit(model, rpm, tpm=None):
+    """Overrides a model's limits (e.g. for your account tier, or in benchmarks)."""
+    with _lock:
+        RATE_LIMITS[model] = (rpm, tpm)
+        _limiters[model] = RateLimiter(rpm, tpm)
+
+
+# ============================================================
+# 2. SHARED CLIENTS
+# ============================================================
+
+def _openai():
+    """The openai SDK, imported on first use: it takes longer to import than the rest of the app."""
+    import openai
+    return openai
+
+
+def _retryable():
+    openai = _openai()
+    return openai.RateLimitError, openai.InternalServerError, openai.APIConnectionError
+
+
+def _timeout():
+    return _openai().Timeout(REQUEST_TIMEOUT, connect=CONNECT_TIMEOUT)
+
+
+def get_client(api_key, base_url=None):
+    """Process-wide OpenAI client per key, so keep-alive connections are reused.
+
+    SDK retries are disabled; `chat`/`generate_image` retry with backoff and
+    rate limiting instead. `base_url` (or OPENAI_BASE_URL) points at a stub server.
+    """
+    key = (api_key, base_url)
+    with _lock:
+        if key not in _clients:
+            _clients[key] = _openai().OpenAI(api_key=api_key, base_url=base_url, timeout=_timeout(), max_retries=0)
+        return _clients[key]
+
+
+def new_async_client(api_key, base_url=None):
+    """AsyncOpenAI client with the same settings. Async clients are bound to one
+    event loop, so callers own (and close) one per asyncio.run."""
+    return _openai().AsyncOpenAI(api_key=api_key, base_url=base_url, timeout=_timeout(), max_retries=0)
+
+
+# ============================================================
+# 3. CALLS WITH RETRIES
+# ============================================================
+
+def _retry_delay(attempt, err):
+    response = getattr(err, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    try:
+        return min(float(retry_after), BACKOFF_CAP)
+    except (TypeError, ValueError):
+        return min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt) * random.uniform(0.5, 1.0)
+
+
+def _estimate(model, messages, kwargs):
+    prompt = sum(count_tokens(m["content"], model) + 4 for m in messages)
+    return prompt + kwargs.get("max_tokens", DEFAULT_OUTPUT_TOKENS)
+
+
+def _record(model, usage, limiter, reserved):
+    if usage is None:
+        return
+    limiter.settle(reserved, usage.total_tokens)
+    trace.record_usage(model, usage.prompt_tokens, usage.completion_tokens)
+
+
+def _metered(stream, model, limiter, reserved, attrs):
+    """Passes stream chunks through; records usage (last chunk) and the call's span when it ends."""
+    with trace.span("llm.chat", **attrs):
+        for chunk in stream:
+            if getattr(chunk, "usage", None) is not None:
+                _record(model, chunk.usage, limiter, reserved)
+            yield chunk
+
+
+def chat(api_key, model, messages, base_url=None, **kwargs):
+    """chat.completions.create through the shared client, rate limiter and retry policy.
+
+    Retries 429, 5xx, connection errors and timeouts with exponential backoff
+    (honouring Retry-After). With stream=True only opening the stream is
+    retried; the returned iterator is consumed by the caller. Raises the last
+    OpenAI error when retries are exhausted. Token usage and wall time are
+    recorded on the current trace.
+    """
+    client = get_client(api_key, base_url)
+    limiter = get_limiter(model)
+    reserved = _estimate(model, messages, kwargs)
+    if kwargs.get("stream"):
+        kwargs.setdefault("stream_options", {"include_usage": True})
+    attrs = {"model": model, "stream": bool(kwargs.get("stream"))}
+    start = time.perf_counter()
+    for attempt in range(MAX_RETRIES + 1):
+        attrs["attempts"] = attempt + 1
+        limiter.acquire(reserved)
+        try:
+            resp = client.chat.completions.create(model=model, messages=messages, **kwargs)
+        except _retryable() as e:
+            limiter.settle(reserved, 0)  # a failed attempt used no tokens
+            if attempt == MAX_RETRIES:
+                raise
+            time.sleep(_retry_delay(attempt, e))
+            continue
+        if kwargs.get("stream"):
+            attrs["open_s"] = round(time.perf_counter() - start, 6)
+            return _metered(resp, model, limiter, reserved, attrs)
+        _record(model, getattr(resp, "usage", None), limiter, reserved)
+        trace.record_span("llm.chat", time.perf_counter() - start, **attrs)
+        return resp
+
+
+async def achat(client, model, messages, **kwargs):
+    """Async `chat` for a caller-owned AsyncOpenAI client (see new_async_client)."""
+    limiter = get_limiter(model)
+    reserved = _estimate(model, messages, kwargs)
+    start = time.perf_counter()
+    for attempt in range(MAX_RETRIES + 1):
+        await asyncio.to_thread(limiter.acquire, reserved)
+        try:
+            resp = await client.chat.completions.create(model=model, messages=messages, **kwargs)
+        except _retryable() as e:
+            limiter.settle(reserved, 0)
+            if attempt == MAX_RETRIES:
+                raise
+            await asyncio.sleep(_retry_delay(attempt, e))
+            continue
+        _record(model, resp.usage, limiter, reserved)
+        trace.record_span("llm.chat", time.perf_counter() - start, model=model, stream=False, attempts=attempt + 1)
+        return resp
+
+
+def generate_image(api_key, base_url=None, **kwargs):
+    """images.generate with the same limiter and retry policy as `chat`."""
+    client = get_client(api_key, base_url)
+    model = kwargs.get("model", "dall-e-3")
+    limiter = get_limiter(model)
+    with trace.span("llm.image", model=model) as attrs:
+        for attempt in range(MAX_RETRIES + 1):
+            attrs["attempts"] = attempt + 1
+            limiter.acquire()
+            try:
+                resp = client.images.generate(**kwargs)
+            except _retryable() as e:
+                if attempt == MAX_RETRIES:
+                    raise
+                time.sleep(_retry_delay(attempt, e))
+                continue
+            trace.record_usage(model, images=len(resp.data))
+            return resp
+
+
+# ============================================================
+# 4. RESPONSE CACHE
+# ============================================================
+
+_skip_cache = contextvars.ContextVar("figuremate_skip_response_cache", default=False)
+
+
+@contextmanager
+def skip_response_cache(skip=True):
+    """Within the block (and jobs submitted from it) responses are fetched fresh, then re-recorded.
+
+    Ignored in replay mode, which only serves recorded responses.
+    """
+    token = _skip_cache.set(skip)
+    try:
+        yield
+    finally:
+        _skip_cache.reset(token)
+
+
+def _lookup(kind, model, prompt, temperature):
+    """Returns (cache, key, value); cache is None when caching is off, value None on a miss."""
+    store = cache.default_response_cache()
+    if store is None:
+        return None, None, None
+    key = cache.response_key(kind, model, prompt, temperature)
+    if _skip_cache.get() and not cache.replaying():  # replay never calls the API
+        return store, key, None
+    value = store.get(key)
+    if value is not None:
+        trace.record_span("llm.cache_hit", 0.0, kind=kind, model=model)
+    elif cache.replaying():
+        raise ReplayMiss(f"no recorded {kind} response for {model} ({key[:12]})")
+    return store, key, value
+
+
+def cached(kind, model, prompt, temperature, compute):
+    """`compute()` behind the response cache (opt-in, FIGUREMATE_LLM_CACHE).
+
+    `prompt` is whatever determines the response besides model and
+    temperature (usually the messages). Values must be JSON-serializable;
+    None results and exceptions are not recorded.
+    """
+    store, key, value = _lookup(kind, model, prompt, temperature)
+    if value is None:
+        value = compute()
+        if store is not None and value is not None:
+            store.put(key, value, kind=kind, model=model)
+    return value
+
+
+async def acached(kind, model, prompt, temperature, compute):
+    """Async `cached`: `compute()` returns an awaitable."""
+    store, key, value = _lookup(kind, model, prompt, temperature)
+    if value is None:
+        value = await compute()
+        if store is not None and value is not None:
+            store.put(key, value, kind=kind, model=model)
+    return value
+
+
+def cached_stream(kind, model, prompt, temperature, open_stream):
+    """Streaming `cached`: yields text deltas from `open_stream()`, or a recorded
+    response as a single delta. Only a stream read to the end is recorded."""
+    store, key, value = _lookup(kind, model, prompt, temperature)
+    if value is not None:
+        yield value
+        return
+    parts = []
+    for delta in open_stream():
+        parts.append(delta)
+        yield delta
+    if store is not None:
+        store.put(key, "".join(parts), kind=kind, model=model)
@@ -0,0 +1,597 @@
+import asyncio
+import contextvars
+import json
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from figuremate import llm, trace
+from figuremate.context import count_tokens, select_context
+from figuremate.export import bytes_to_base64, compile_preview
+from figuremate.jobs import JobCancelled
+from figuremate.sections import DOC_HEADER_PAT, doc_header, figure_tags, outline, parse_sections, splice_sections
+
+HTTP_TIMEOUT = (5, 30)          # (connect, read) seconds for image downloads
+HERO_PROMPT_MODEL = "gpt-4o-mini"
+HERO_GRACE_SECONDS = 3          # how long "Assembling" waits for a late hero image
+MAP_CHUNK_CHARS = 24000         # map-reduce: max source characters per summarization call
+MAP_CONCURRENCY = 8             # map-reduce: summarization calls in flight at once
+REDUCE_CHARS = 100000           # map-reduce: notes the report call may receive, shared fairly by the documents
+REFINE_HISTORY_TOKENS = 300     # refinement: budget for past edit requests in the prompt
+INDEX_CAPTION_CHARS = 40        # refinement: caption length in the index of unused figures
+
+
+# ============================================================
+# 1. UTILITY FUNCTIONS
+# ============================================================
+
+# Process-wide keep-alive pool for image downloads, created by the first download
+_http = None
+_http_lock = threading.Lock()
+
+# Background work that must not block the script thread (hero image pipeline)
+_background = ThreadPoolExecutor(max_workers=8, thread_name_prefix="figuremate-bg")
+
+
+def _http_session():
+    global _http
+    with _http_lock:
+        if _http is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            _http = requests.Session()
+            _http.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=2))
+        return _http
+
+
+def download_image(url):
+    """Downloads an image over the pooled session. Returns a data URI or None."""
+    import requests  # deferred: loads with the first hero image
+
+    with trace.span("download") as attrs:
+        try:
+            resp = _http_session().get(url, timeout=HTTP_TIMEOUT)
+            resp.raise_for_status()
+            attrs["bytes"] = len(resp.content)
+            return bytes_to_base64(resp.content)
+        except requests.RequestException:
+            attrs["error"] = True
+            return None
+
+
+def build_asset_list(figures):
+    """Builds a text description of available figures for LLM prompts."""
+    if not figures:
+        return "AVAILABLE FIGURES:\n(No figures available)"
+    lines = ["AVAILABLE FIGURES:"]
+    for fid, data in figures.items():
+        lines.append(f"- [[{fid}]]: {data['caption'][:100]}... (Source: {data['source']})")
+    return "\n".join(lines)
+
+
+def build_refine_asset_list(figures, used):
+    """Figure list for refinement prompts: full entries for the figures in `used`
+    (those the text being edited references), a one-line ID index for the rest."""
+    lines = ["AVAILABLE FIGURES:"]
+    lines += [f"- [[{fid}]]: {d['caption'][:100]}... (Source: {d['source']})" for fid, d in figures.items() if fid in used]
+    if len(lines) == 1:
+        lines.append("(None used yet)")
+    others = [f"{fid}: {d['caption'][:INDEX_CAPTION_CHARS]}" for fid, d in figures.items() if fid not in used]
+    if others:
+        lines.append("OTHER FIGURES (not used yet; insert as [[ID]]): " + " | ".join(others))
+    return "\n".join(lines)
+
+
+def compact_history(history, model="gpt-4o", budget=REFINE_HISTORY_TOKENS):
+    """Past edit requests as prompt lines, newest last, within `budget` tokens.
+
+    They are already applied to the report, so the model only needs them as a
+    reminder: the newest are kept verbatim, older ones are cut to one short
+    line, and whatever still does not fit is dropped with a count.
+    """
+    lines, used = [], 0
+    for i, entry in enumerate(reversed(history or [])):
+        line = f"- {entry}"
+        tokens = count_tokens(line, model)
+        if used + tokens > budget and len(entry) > 60:
+            line = f"- {entry[:60]}..."
+            tokens = count_tokens(line, model)
+        if used + tokens > budget:
+            lines.append(f"- ({len(history) - i} earlier edit(s) omitted)")
+            break
+        lines.append(line)
+        used += tokens
+    return "\n".join(reversed(lines))
+
+
+def _history_block(lines):
+    return f"[Previous Edit History]\n{lines}\n" if lines else ""
+
+
+def _refine_context(figures, used, history, model):
+    """(asset list, history block) for a refinement prompt. Records the prompt
+    tokens they take and how many the full forms would have taken more."""
+    assets = build_refine_asset_list(figures, used)
+    history_text = _history_block(compact_history(history, model))
+    tokens = count_tokens(assets + history_text, model)
+    full = count_tokens(build_asset_list(figures) + _history_block("\n".join(f"- {h}" for h in history or [])), model)
+    trace.record_span("refine.context", 0.0, tokens=tokens, saved_tokens=full - tokens)
+    return assets, history_text
+
+
+def build_context(full_text, figures, model, map_reduce=False):
+    """Model input for a report. Returns (context, tokens).
+
+    Map-reduce summarizes everything, so it gets the full text; otherwise
+    relevance-ranked chunks are packed into the model's budget.
+    """
+    if map_reduce:
+        return full_text, count_tokens(full_text, model)
+    return select_context(full_text, figures, model)
+
+
+# ============================================================
+# 2. AI ORCHESTRATION (Generation + Refinement)
+# ============================================================
+
+def _report_messages(text, figures):
+    """Chat messages for first-pass report generation."""
+    asset_list = build_asset_list(figures)
+
+    system_prompt = f"""
+You are an Expert Technical Analyst.
+
+{asset_list}
+
+[Instruction]
+Synthesize the provided documents into ONE cohesive, definitive professional technical report.
+Do NOT just list summaries. Weave a compelling narrative.
+
+[Structure - STRICTLY FOLLOW]
+
+# [Compelling Main Title]
+
+## 1. Introduction
+(Context, Problem Statement, and Background)
+
+## 2. Core Architecture & Methodology
+(Explain the 'How'. *CRITICAL: Insert [[IMG_XX]] tags here naturally to illustrate concepts.*)
+
+## 3. Deep Dive Analysis
+(Performance, nuances, comparisons, and results.)
+
+## 4. Conclusion & Verdict
+(Final thoughts, future outlook, and takeaways.)
+
+## 5. References
+(List the source documents used in the analysis.)
+
+[Formatting Rules]
+- Use clear headings (##).
+- Use bullet points (-) for listing features.
+- Use bold type (**) for emphasis.
+- Output ONLY the report Markdown.
+"""
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": text}
+    ]
+
+
+def _deltas(stream):
+    """Content deltas of a chat completion stream."""
+    for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+
+def _content(api_key, model, messages, temperature, **kwargs):
+    """Message content of one non-streaming chat call."""
+    resp = llm.chat(api_key, model=model, messages=messages, temperature=temperature, **kwargs)
+    return resp.choices[0].message.content
+
+
+def generate_report(api_key, text, figures, model="gpt-4o"):
+    """First-pass report generation with structured prompt."""
+    messages = _report_messages(text, figures)
+    try:
+        return llm.cached("report", model, messages, 0.4, lambda: _content(api_key, model, messages, 0.4))
+    except Exception as e:
+        return f"Error: {e}"
+
+
+def generate_report_stream(api_key, text, figures, model="gpt-4o"):
+    """Streaming variant of generate_report. Yields content deltas; raises on API errors."""
+    messages = _report_messages(text, figures)
+    yield from llm.cached_stream("report", model, messages, 0.4, lambda: _deltas(llm.chat(
+        api_key,
+        model=model,
+        messages=messages,
+        temperature=0.4,
+        stream=True
+    )))
+
+
+def _refine_messages(original_text, instruction, figures, history=None, model="gpt-4o"):
+    """Chat messages for a refinement turn."""
+    asset_list, history_text = _refine_context(figures, set(figure_tags(original_text)), history, model)
+
+    system_prompt = f"""
+You are a meticulous Senior Technical Editor.
+Rewrite the [Original Report] below according to the [User Edit Request].
+
+{asset_list}
+
+{history_text}
+[CRITICAL RULES]
+1. Output the COMPLETE rewritten report from beginning to end. Never output only the changed section.
+2. User instructions (and past history) ALWAYS OVERRIDE default formats. Maintain the language, tone, and structural format established in the [Original Report] unless requested otherwise. Do NOT force a default structure if the user asked for a custom format (e.g., brief summary, table, specific sections).
+3. PRESERVE all existing [[IMG_XX]] tags. Keep them in context or move them to a better position. NEVER delete them.
+4. Do NOT include conversational filler like "Sure, here's the revised version". Output ONLY raw Markdown.
+"""
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": f"[Original Report]\n{original_text}\n\n[User Edit Request]\n{instruction}"}
+    ]
+
+
+def strip_code_fences(content):
+    """Strips accidental ```markdown fences around a refined report."""
+    content = content.strip()
+    if content.startswith("```"):
+        content = re.sub(r"^```(?:markdown)?\n?", "", content)
+        content = re.sub(r"\n?```$", "", content)
+    return content.strip()
+
+
+def refine_report(api_key, original_text, instruction, figures, history=None, model="gpt-4o"):
+    """Context-aware refinement with figure registry re-injection and history context."""
+    messages = _refine_messages(original_text, instruction, figures, history, model)
+    try:
+        content = llm.cached("refine", model, messages, 0.3, lambda: _content(api_key, model, messages, 0.3))
+        return strip_code_fences(content)
+    except Exception as e:
+        return f"Error: {e}"
+
+
+def refine_report_stream(api_key, original_text, instruction, figures, history=None, model="gpt-4o"):
+    """Streaming variant of refine_report. Yields raw deltas (pass the joined text through
+    strip_code_fences); raises on API errors."""
+    messages = _refine_messages(original_text, instruction, figures, history, model)
+    yield from llm.cached_stream("refine", model, messages, 0.3, lambda: _deltas(llm.chat(
+        api_key,
+        model=model,
+        messages=messages,
+        temperature=0.3,
+        stream=True
+    )))
+
+
+def plan_refinement(api_key, report, instruction, model="gpt-4o-mini"):
+    """Decides which `##` sections an edit request targets (cheap JSON call on the outline).
+
+    Returns a sorted list of section indices, or None when the request is global
+    (tone, length, language, restructuring...) or the plan cannot be trusted.
+    """
+    _, sections = parse_sections(report)
+    if len(sections) < 2:
+        return None
+    messages = [
+        {"role": "system", "content": (
+            "You route edit requests for a Markdown report. Given its outline and a request, reply as JSON: "
+            '{"scope": "sections", "sections": [indices]} if the request only concerns specific sections, or '
+            '{"scope": "global"} if it changes the whole report (length, tone, language, format, structure, '
+            "adding/removing/reordering sections)."
+        )},
+        {"role": "user", "content": f"[Outline]\n{outline(sections)}\n\n[Request]\n{instruction}"}
+    ]
+    try:
+        plan = json.loads(llm.cached("plan", model, messages, 0, lambda: _content(
+            api_key, model, messages, 0, response_format={"type": "json_object"})))
+    except Exception:
+        return None
+    targets = sorted({i for i in plan.get("sections", []) if isinstance(i, int) and 0 <= i < len(sections)})
+    if plan.get("scope") != "sections" or not targets or len(targets) == len(sections):
+        return None
+    return targets
+
+
+def refine_report_sections(api_key, original_text, targets, instruction, figures, history=None, model="gpt-4o"):
+    """Patch refinement: rewrites only sections `targets` and splices them back in.
+
+    The model sees the targeted sections in full, a compact outline of the rest,
+    and only the figures those sections can use. Returns the full new report,
+    or "Error: ..." (the caller then falls back to refine_report).
+    """
+    _, sections = parse_sections(original_text)
+    targeted = "\n\n".join(sections[i].strip() for i in targets)
+    used = set(figure_tags(original_text))
+    in_targets = set(figure_tags(targeted))
+    asset_list, history_text = _refine_context(
+        {fid: d for fid, d in figures.items() if fid not in used or fid in in_targets}, in_targets, history, model)
+
+    system_prompt = f"""
+You are a meticulous Senior Technical Editor.
+Rewrite ONLY the [Sections To Edit] below according to the [User Edit Request].
+
+[Full Report Outline]
+{outline(sections)}
+
+{asset_list}
+
+{history_text}
+[CRITICAL RULES]
+1. Output exactly {len(targets)} section(s), in the same order, each starting with its "## " heading line. Nothing else.
+2. Keep the language, tone and format of the report. Do not repeat content that belongs to other sections of the outline.
+3. PRESERVE all [[IMG_XX]] tags of these sections. Keep them in context or move them to a better position. NEVER delete them.
+4. Do NOT include conversational filler. Output ONLY raw Markdown.
+"""
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": f"[Sections To Edit]\n{targeted}\n\n[User Edit Request]\n{instruction}"}
+    ]
+    try:
+        content = llm.cached("sections", model, messages, 0.3, lambda: _content(api_key, model, messages, 0.3))
+        patched = splice_sections(original_text, targets, strip_code_fences(content))
+    except Exception as e:
+        return f"Error: {e}"
+    return patched if patched is not None else "Error: section count mismatch in patch"
+
+
+def split_documents(text):
+    """Splits merged ingestion text back into [(name, body)] on its document headers."""
+    parts = DOC_HEADER_PAT.split(text)
+    return [(parts[i], parts[i + 1].strip()) for i in range(1, len(parts) - 1, 2)]
+
+
+def chunk_text(text, size=MAP_CHUNK_CHARS):
+    """Cuts text into pieces of at most `size` chars, preferring paragraph/line breaks."""
+    chunks = []
+    while len(text) > size:
+        cut = text.rfind("\n\n", size // 2, size)
+        if cut < 0:
+            cut = text.rfind("\n", size // 2, size)
+        if cut < 0:
+            cut = size
+        chunks.append(text[:cut])
+        text = text[cut:].lstrip()
+    if text.strip():
+        chunks.append(text)
+    return chunks
+
+
+async def _summarize_chunk(client, semaphore, model, name, index, total, chunk, figures):
+    doc_figures = {fid: d for fid, d in figures.items() if d['source'] == name}
+    system_prompt = f"""
+You are an Expert Technical Analyst preparing notes for a later synthesis step.
+
+{build_asset_list(doc_figures)}
+
+Summarize the excerpt below (part {index} of {total} of "{name}") into dense Markdown notes:
+problem, methods/architecture, key results with exact numbers, limitations.
+Cite figures from the list above with their [[IMG_XX]] tag where the excerpt discusses them.
+Output ONLY the notes.
+"""
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": chunk}
+    ]
+
+    async def summarize():
+        async with semaphore:
+            resp = await llm.achat(client, model=model, messages=messages, temperature=0.2)
+        return resp.choices[0].message.content
+
+    return (await llm.acached("summary", model, messages, 0.2, summarize)).strip()
+
+
+async def _condense_notes(client, semaphore, model, name, notes, chars):
+    """Second reduce level: rewrites one document's notes into about `chars` characters."""
+    system_prompt = f"""
+You are an Expert Technical Analyst preparing notes for a later synthesis step.
+
+The notes below on "{name}" are too long. Condense them into at most {chars} characters of dense
+Markdown notes. Keep the problem, methods, key results with exact numbers and limitations, and keep
+every [[IMG_XX]] tag that still fits. Output ONLY the notes.
+"""
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": notes}
+    ]
+
+    async def condense():
+        async with semaphore:
+            resp = await llm.achat(client, model=model, messages=messages, temperature=0.2)
+        return resp.choices[0].message.content
+
+    return (await llm.acached("condense", model, messages, 0.2, condense)).strip()
+
+
+async def _gather_all(api_key, make_calls):
+    """Runs the coroutines `make_calls(client, semaphore)` returns with one async client; exceptions are returned."""
+    client = llm.new_async_client(api_key)
+    semaphore = asyncio.Semaphore(MAP_CONCURRENCY)
+    try:
+        return await asyncio.gather(*make_calls(client, semaphore), return_exceptions=True)
+    finally:
+        await client.close()
+
+
+def reduce_shares(sizes, budget):
+    """Characters each document's notes may take: equal shares of `budget`, where what
+    shorter documents leave unused is split among the longer ones. `sizes` maps name -> chars."""
+    shares = {}
+    pending = sorted(sizes, key=sizes.get)
+    while pending and sizes[pending[0]] <= budget // len(pending):
+        name = pending.pop(0)
+        shares[name] = sizes[name]
+        budget -= sizes[name]
+    for name in pending:
+        shares[name] = budget // len(pending)
+    return shares
+
+
+def summarize_documents(api_key, text, figures, model="gpt-4o"):
+    """Map step of map-reduce synthesis: summarizes every document chunk concurrently.
+
+    Returns the merged notes (one section per document) to feed generate_report
+    in place of the raw text, or "Error: ..." if every chunk failed. When the
+    notes exceed REDUCE_CHARS, each document over its share (see reduce_shares)
+    is condensed by another call, so no document is dropped or cut off.
+    """
+    jobs = []
+    for name, body in split_documents(text):
+        chunks = chunk_text(body)
+        jobs.extend((name, i + 1, len(chunks), chunk) for i, chunk in enumerate(chunks))
+    if not jobs:
+        return "Error: no document text to summarize"
+
+    results = asyncio.run(_gather_all(api_key, lambda client, semaphore: [
+        _summarize_chunk(client, semaphore, model, *job, figures) for job in jobs]))
+    if all(isinstance(r, Exception) for r in results):
+        return f"Error: {results[0]}"
+
+    sections = {}
+    for (name, index, total, _), result in zip(jobs, results):
+        note = "(This part could not be summarized.)" if isinstance(result, Exception) else result
+        sections.setdefault(name, []).append(f"[Part {index}/{total}]\n{note}" if total > 1 else note)
+    notes = {name: "\n\n".join(parts) for name, parts in sections.items()}
+
+    headers = sum(len(doc_header(name)) + 3 for name in notes)
+    shares = reduce_shares({name: len(n) for name, n in notes.items()}, REDUCE_CHARS - headers)
+    over = [name for name in notes if len(notes[name]) > shares[name]]
+    if over:
+        with trace.span("report.condense", docs=len(over)):
+            condensed = asyncio.run(_gather_all(api_key, lambda client, semaphore: [
+                _condense_notes(client, semaphore, model, name, notes[name], shares[name]) for name in over]))
+        for name, result in zip(over, condensed):
+            if not isinstance(result, Exception):
+                notes[name] = result  # on failure the full notes are kept rather than cut
+    return "\n\n".join(f"{doc_header(name)}\n{n}" for name, n in notes.items())
+
+
+def generate_hero_image(api_key, prompt_text):
+    """Generates a DALL-E 3 hero image."""
+    try:
+        resp = llm.generate_image(
+            api_key, model="dall-e-3", prompt=prompt_text[:4000],
+            size="1024x1024", quality="standard", n=1
+        )
+        return resp.data[0].url
+    except Exception:
+        return None
+
+
+def draft_hero_prompt(api_key, text):
+    """Derives a DALL-E prompt from the source documents with one short, cheap call.
+
+    Runs before the report exists so the image can be drawn in parallel with it;
+    falls back to the document titles if the call fails.
+    """
+    titles = DOC_HEADER_PAT.findall(text)
+    fallback = f"Abstract technology concept art for: {', '.join(titles)}" if titles else "Abstract Technology"
+    messages = [
+        {"role": "system", "content": "Write ONE DALL-E 3 prompt (max 60 words) for a sleek, text-free "
+                                      "hero image capturing the theme of these documents. Output only the prompt."},
+        {"role": "user", "content": text[:4000]}
+    ]
+    try:
+        content = llm.cached("hero_prompt", HERO_PROMPT_MODEL, messages, 0.7, lambda: _content(
+            api_key, HERO_PROMPT_MODEL, messages, 0.7, max_tokens=120))
+        return content.strip() or fallback
+    except Exception:
+        return fallback
+
+
+def build_hero(api_key, text):
+    """Hero pipeline for a background thread: prompt -> DALL-E -> download. Returns (url, b64).
+
+    The downloaded image is cached by prompt. DALL-E URLs expire after an
+    hour, so a cached hero comes back with its data URI as the URL.
+    """
+    prompt = draft_hero_prompt(api_key, text)
+    fresh = {}
+
+    def draw():
+        fresh["url"] = generate_hero_image(api_key, prompt)
+        return download_image(fresh["url"]) if fresh["url"] else None
+
+    try:
+        hero_b64 = llm.cached("hero", "dall-e-3", prompt, None, draw)
+    except llm.ReplayMiss:
+        return None, None
+    return fresh.get("url") or hero_b64, hero_b64
+
+
+# ============================================================
+# 3. REPORT PIPELINE
+# ============================================================
+
+def run_report_pipeline(job, api_key, extracted_data, figure_data, model="gpt-4o", map_reduce=False, stream=True,
+                        hero=True, hero_grace=HERO_GRACE_SECONDS):
+    """Report job body: (Summarizing) -> Drafting -> (Visualizing) -> Assembling.
+
+    `job` receives the stages (`set_stage`) and, with `stream`, the report as
+    it is written (`append`); see figuremate.jobs.Job. The hero image waits at
+    most `hero_grace` seconds (None: until done). Returns the final_result
+    dict (plus "pending_hero": a hero future that missed the grace period, or
+    None) or an "Error: ..." string.
+    """
+    # Hero image runs alongside drafting; joined in "Visualizing". It runs in a
+    # copy of this context so its calls land on the caller's trace.
+    hero_future = None
+    if hero:
+        hero_future = _background.submit(contextvars.copy_context().run, build_hero, api_key, extracted_data)
+    try:
+        source_text = extracted_data
+        if map_reduce:
+            job.set_stage("Summarizing")
+            with trace.span("report.summarize"):
+                source_text = summarize_documents(api_key, extracted_data, figure_data, model)
+
+        job.set_stage("Drafting")
+        if source_text.startswith("Error:"):
+            raw = source_text
+        elif stream:
+            raw = ""
+            try:
+                with trace.span("report.draft", stream=True):
+                    for delta in generate_report_stream(api_key, source_text, figure_data, model):
+                        job.append(delta)
+                        raw += delta
+            except JobCancelled:
+                raise
+            except Exception as e:
+                raw = f"Error: {e}"
+        else:
+            with trace.span("report.draft", stream=False):
+                raw = generate_report(api_key, source_text, figure_data, model)
+        if raw.startswith("Error:"):
+            if hero_future:
+                hero_future.cancel()
+            return raw
+        blog = raw.split("|||")[0].strip()  # tolerate a trailing DALL-E prompt from older prompts
+
+        hero_url, hero_b64, pending_hero = None, None, None
+        if hero_future:
+            job.set_stage("Visualizing")
+            try:
+                with trace.span("report.hero_wait"):
+                    hero_url, hero_b64 = hero_future.result(timeout=hero_grace)
+            except FutureTimeout:
+                # Don't hold the report for a slow image; attached on a later rerun
+                pending_hero = hero_future
+
+        job.set_stage("Assembling")
+        return {
+            "blog": blog,
+            "hero_url": hero_url,
+            "preview_md": compile_preview(blog, bool(hero_b64), figure_data),
+            "figures": figure_data,
+            "hero_b64": hero_b64,
+            "pending_hero": pending_hero,
+        }
+    except JobCancelled:
+        if hero_future:
+            hero_future.cancel()
+        raise
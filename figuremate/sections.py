@@ -0,0 +1,82 @@
+import re
+from functools import lru_cache
+
+_H2_PAT = re.compile(r"^##(?!#)[ \t]", re.MULTILINE)
+# Figure tag in a report: [[IMG_1_01]] (also single brackets, and the older IMG_03 IDs)
+TAG_PAT = re.compile(r"\[\[?(IMG_\d+(?:_\d+)?)\]?\]", re.IGNORECASE)
+# Separator line before each document in merged ingestion text
+DOC_HEADER_PAT = re.compile(r"^--- Document: (.+) ---$", re.MULTILINE)
+
+
+def doc_header(name):
+    """The DOC_HEADER_PAT line for a document."""
+    return f"--- Document: {name} ---"
+
+
+def parse_sections(report):
+    """Splits a report on `##` headings. Returns (preamble, [section, ...]).
+
+    The preamble is everything before the first `##` (usually the `#` title);
+    each section keeps its heading line and trailing whitespace, so
+    `preamble + "".join(sections) == report`.
+    """
+    starts = [m.start() for m in _H2_PAT.finditer(report)]
+    if not starts:
+        return report, []
+    bounds = starts + [len(report)]
+    return report[:starts[0]], [report[a:b] for a, b in zip(bounds, bounds[1:])]
+
+
+def section_title(section):
+    return section.split("\n", 1)[0].lstrip("#").strip()
+
+
+def figure_tags(text):
+    """IMG IDs referenced by [[IMG_XX]] tags, upper-cased, in order of first use."""
+    return list(dict.fromkeys(m.upper() for m in TAG_PAT.findall(text)))
+
+
+@lru_cache(maxsize=16)
+def report_segments(report):
+    """Report split for rendering: a tuple of ("text", markdown) and ("figure", IMG_ID).
+
+    Memoized on the report text, so Streamlit reruns of an unchanged report
+    skip the regex work. Whitespace-only text is dropped.
+    """
+    segments = []
+    for i, part in enumerate(TAG_PAT.split(report)):
+        if i % 2:
+            segments.append(("figure", part.upper()))
+        elif part.strip():
+            segments.append(("text", part))
+    return tuple(segments)
+
+
+def outline(sections):
+    """Compact numbered outline: one line per section with its size and figure tags."""
+    lines = []
+    for i, sec in enumerate(sections):
+        tags = figure_tags(sec)
+        extra = f"; {', '.join(tags)}" if tags else ""
+        lines.append(f"[{i}] ## {section_title(sec)} ({len(sec.split())} words{extra})")
+    return "\n".join(lines)
+
+
+def splice_sections(report, targets, rewritten):
+    """Replaces sections `targets` of `report` with the `##` sections in `rewritten`.
+
+    Returned sections are matched to targets by order. Any [[IMG_XX]] tag a
+    target used that its rewrite dropped is appended to the rewrite, so tags are
+    never lost. Returns the new report, or None if the section count differs.
+    """
+    preamble, sections = parse_sections(report)
+    _, new_sections = parse_sections(rewritten.strip() + "\n")
+    if len(new_sections) != len(targets):
+        return None
+    for idx, new in zip(targets, new_sections):
+        new = new.strip()
+        missing = [t for t in figure_tags(sections[idx]) if t not in figure_tags(new)]
+        if missing:
+            new += "\n\n" + "\n\n".join(f"[[{t}]]" for t in missing)
+        sections[idx] = new + ("\n\n" if idx < len(sections) - 1 else "\n")
+    return preamble + "".join(sections)
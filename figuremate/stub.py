@@ -0,0 +1,183 @@
+"""Local stand-in for the OpenAI chat-completions and images endpoints.
+
+    python -m figuremate.stub --port 8765 --latency 0.5
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 streamlit run app.py
+
+`python -m figuremate batch --stub` starts one in-process for offline runs.
+
+Responses are canned but shaped like the real API (including SSE streaming
+and `usage`). `latency` delays every response; `fail_first` answers the first
+N API requests with 429 (Retry-After: 0) to exercise retry paths.
+"""
+import argparse
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import fitz  # PyMuPDF
+
+CANNED_REPORT = """# Synthetic Report
+
+## 1. Introduction
+Stub introduction for benchmarking.
+
+## 2. Core Architecture & Methodology
+The method is illustrated here. [[IMG_1_01]]
+
+## 3. Deep Dive Analysis
+Results are discussed with numbers: 42% faster.
+
+## 4. Conclusion & Verdict
+Stub conclusion.
+
+## 5. References
+- paper_1.pdf
+"""
+
+
+def _hero_png():
+    return fitz.Pixmap(fitz.csRGB, 64, 64, bytes(64 * 64 * 3), False).tobytes("png")
+
+
+class StubState:
+    def __init__(self, latency=0.0, fail_first=0, token_latency=0.0):
+        self.latency = latency
+        self.token_latency = token_latency
+        self.fail_remaining = fail_first
+        self.requests = 0
+        self.connections = set()
+        self.lock = threading.Lock()
+        self.hero_png = _hero_png()
+
+    def reply_for(self, body):
+        if body.get("response_format", {}).get("type") == "json_object":
+            return json.dumps({"scope": "global"})
+        return CANNED_REPORT
+
+
+def _make_handler(state):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive, so connection reuse is observable
+
+        def log_message(self, *args):
+            pass
+
+        def _send_json(self, code, payload, headers=None):
+            data = json.dumps(payload).encode()
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _admit(self):
+            with state.lock:
+                state.requests += 1
+                state.connections.add(self.client_address)
+                if state.fail_remaining > 0:
+                    state.fail_remaining -= 1
+                    fail = True
+                else:
+                    fail = False
+            if fail:
+                self._send_json(429, {"error": {"message": "stub rate limit", "type": "rate_limit"}},
+                                {"Retry-After": "0"})
+                return False
+            time.sleep(state.latency)
+            return True
+
+        def do_GET(self):
+            if self.path.endswith("/hero.png"):
+                self.send_response(200)
+                self.send_header("Content-Type", "image/png")
+                self.send_header("Content-Length", str(len(state.hero_png)))
+                self.end_headers()
+                self.wfile.write(state.hero_png)
+            else:
+                self._send_json(404, {"error": {"message": "not found"}})
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            if not self._admit():
+                return
+            if self.path.endswith("/chat/completions"):
+                self._chat(body)
+            elif self.path.endswith("/images/generations"):
+                host = self.headers.get("Host")
+                self._send_json(200, {"created": int(time.time()), "data": [{"url": f"http://{host}/images/hero.png"}]})
+            else:
+                self._send_json(404, {"error": {"message": "not found"}})
+
+        def _chat(self, body):
+            content = state.reply_for(body)
+            prompt_tokens = sum(len(m.get("content", "")) for m in body.get("messages", [])) // 4
+            usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(content) // 4,
+                     "total_tokens": prompt_tokens + len(content) // 4}
+            base = {"id": "chatcmpl-stub", "created": int(time.time()), "model": body.get("model", "gpt-4o")}
+            if not body.get("stream"):
+                self._send_json(200, {**base, "object": "chat.completion", "usage": usage, "choices": [
+                    {"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}
+                ]})
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+
+            def emit(payload):
+                data = f"data: {payload}\n\n".encode()
+                self.wfile.write(f"{len(data):X}\r\n".encode() + data + b"\r\n")
+                self.wfile.flush()
+
+            for i in range(0, len(content), 16):
+                emit(json.dumps({**base, "object": "chat.completion.chunk", "choices": [
+                    {"index": 0, "delta": {"content": content[i:i + 16]}, "finish_reason": None}
+                ]}))
+                time.sleep(state.token_latency)
+            if body.get("stream_options", {}).get("include_usage"):
+                emit(json.dumps({**base, "object": "chat.completion.chunk", "choices": [], "usage": usage}))
+            emit("[DONE]")
+            self.wfile.write(b"0\r\n\r\n")
+
+    return Handler
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        if not isinstance(sys.exc_info()[1], ConnectionError):  # clients closing keep-alive sockets
+            super().handle_error(request, client_address)
+
+
+def start_stub(latency=0.0, fail_first=0, token_latency=0.0, port=0):
+    """Starts the stub in a daemon thread. Returns (server, base_url); stop with server.shutdown()."""
+    state = StubState(latency, fail_first, token_latency)
+    server = _Server(("127.0.0.1", port), _make_handler(state))
+    server.state = state
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--token-latency", type=float, default=0.0)
+    parser.add_argument("--fail-first", type=int, default=0)
+    args = parser.parse_args()
+    server, base_url = start_stub(args.latency, args.fail_first, args.token_latency, args.port)
+    print(f"stub OpenAI listening on {base_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+import logging
+import os
+import re
+from functools import lru_cache
+
+logger = logging.getLogger("figuremate.theme")
+
+# Page CSS and web fonts ship with the app (nothing is fetched from a CDN on page load).
+STATIC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "static")
+# Where the browser finds STATIC_DIR: Streamlit's static file serving (.streamlit/config.toml)
+STATIC_URL = os.environ.get("FIGUREMATE_STATIC_URL", "app/static")
+
+FONT_WEIGHTS = {
+    "thin": 100, "extralight": 200, "light": 300, "regular": 400,
+    "medium": 500, "semibold": 600, "bold": 700, "extrabold": 800, "black": 900,
+}
+FONT_FORMATS = {".woff2": "woff2", ".woff": "woff", ".otf": "opentype", ".ttf": "truetype"}
+FONT_FILE_PAT = re.compile(r"^([A-Za-z][A-Za-z0-9 ]*)-([A-Za-z]+)(\.\w+)$")
+
+
+def font_faces(static_dir=STATIC_DIR, static_url=STATIC_URL):
+    """@font-face rules for the font files in `<static_dir>/fonts`, named `<Family>-<Weight>.<ext>`.
+
+    A family without files falls back to the system fonts listed in the CSS.
+    `local()` comes first so an installed copy is used without a download.
+    """
+    fonts_dir = os.path.join(static_dir, "fonts")
+    try:
+        names = sorted(os.listdir(fonts_dir))
+    except OSError:
+        return ""
+    rules = []
+    for name in names:
+        m = FONT_FILE_PAT.match(name)
+        if not m or m.group(2).lower() not in FONT_WEIGHTS or m.group(3).lower() not in FONT_FORMATS:
+            continue
+        family, weight, ext = m.group(1), m.group(2), m.group(3).lower()
+        rules.append(
+            f"@font-face {{ font-family: '{family}'; font-weight: {FONT_WEIGHTS[weight.lower()]}; "
+            f"font-display: swap; src: local('{family} {weight}'), "
+            f"url('{static_url}/fonts/{name}') format('{FONT_FORMATS[ext]}'); }}"
+        )
+    return "\n".join(rules)
+
+
+@lru_cache(maxsize=1)
+def page_style():
+    """`<style>` block for st.markdown: the bundled fonts plus static/figuremate.css, read once per process."""
+    with open(os.path.join(STATIC_DIR, "figuremate.css"), encoding="utf-8") as f:
+        css = f.read()
+    faces = font_faces()
+    if not faces:
+        logger.warning("No web fonts in %s/fonts: the page falls back to system fonts. "
+                       "Run `python -m figuremate.fonts` at build time.", STATIC_DIR)
+    return f"<style>\n{faces}\n{css}</style>"
@@ -0,0 +1,148 @@
+import contextvars
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+# USD per 1M tokens (input, output) and per generated image.
+TOKEN_PRICES = {
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+}
+IMAGE_PRICES = {"dall-e-3": 0.040}  # standard quality, 1024x1024
+
+# JSON-lines trace log: a file path, "-" for stderr, or unset to disable.
+TRACE_LOG = os.environ.get("FIGUREMATE_TRACE_LOG", "")
+
+logger = logging.getLogger("figuremate.trace")
+_current = contextvars.ContextVar("figuremate_trace", default=None)
+
+
+def _configure_logger():
+    if not TRACE_LOG or logger.handlers:
+        return
+    handler = logging.StreamHandler(sys.stderr) if TRACE_LOG == "-" else logging.FileHandler(TRACE_LOG, encoding="utf-8")
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+
+_configure_logger()
+
+
+def cost(model, prompt_tokens=0, completion_tokens=0, images=0):
+    """USD for a call; unknown models cost 0 (they still show up with their token counts)."""
+    price_in, price_out = TOKEN_PRICES.get(model, (0.0, 0.0))
+    return (prompt_tokens * price_in + completion_tokens * price_out) / 1e6 + images * IMAGE_PRICES.get(model, 0.0)
+
+
+# ============================================================
+# 1. TRACE (one session or batch run)
+# ============================================================
+
+class Trace:
+    """Collects timed spans and token usage; thread-safe.
+
+    Records are plain dicts ({"event": "span" | "usage", ...}) so they can be
+    shipped across processes and written as JSON lines. `log=False` keeps
+    records out of the JSON log (for traces merged into another one later).
+    """
+
+    def __init__(self, trace_id=None, log=True):
+        self.id = trace_id or uuid.uuid4().hex[:12]
+        self.log = log
+        self.records = []
+        self._lock = threading.Lock()
+
+    def add(self, record):
+        record = {"trace": self.id, **record}
+        with self._lock:
+            self.records.append(record)
+        if self.log and logger.handlers:
+            logger.info(json.dumps(record, default=str))
+
+    def stages(self):
+        """{stage: {"count", "total_s", "max_s"}} in first-seen order."""
+        out = {}
+        with self._lock:
+            spans = [r for r in self.records if r["event"] == "span"]
+        for r in spans:
+            s = out.setdefault(r["stage"], {"count": 0, "total_s": 0.0, "max_s": 0.0})
+            s["count"] += 1
+            s["total_s"] += r["seconds"]
+            s["max_s"] = max(s["max_s"], r["seconds"])
+        return out
+
+    def usage(self):
+        """{model: {"calls", "prompt_tokens", "completion_tokens", "images", "cost"}}."""
+        out = {}
+        with self._lock:
+            events = [r for r in self.records if r["event"] == "usage"]
+        for r in events:
+            u = out.setdefault(r["model"], {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0,
+                                            "images": 0, "cost": 0.0})
+            u["calls"] += 1
+            for key in ("prompt_tokens", "completion_tokens", "images", "cost"):
+                u[key] += r.get(key, 0)
+        return out
+
+    def total_cost(self):
+        return sum(u["cost"] for u in self.usage().values())
+
+
+# ============================================================
+# 2. RECORDING
+# ============================================================
+
+def current_trace():
+    return _current.get()
+
+
+@contextmanager
+def use_trace(trace):
+    """Makes `trace` current for this thread/task (and for contexts copied from it)."""
+    token = _current.set(trace)
+    try:
+        yield trace
+    finally:
+        _current.reset(token)
+
+
+def _emit(record):
+    trace = _current.get()
+    if trace is not None:
+        trace.add(record)
+    elif logger.handlers:
+        logger.info(json.dumps(record, default=str))
+
+
+@contextmanager
+def span(stage, **attrs):
+    """Times the block as `stage`. Yields the attrs dict so the block can add results."""
+    start = time.perf_counter()
+    try:
+        yield attrs
+    finally:
+        record_span(stage, time.perf_counter() - start, **attrs)
+
+
+def record_span(stage, seconds, **attrs):
+    """Records an already-measured span (when a `with span(...)` block does not fit)."""
+    _emit({"event": "span", "stage": stage, "seconds": round(seconds, 6), **attrs})
+
+
+def replay(records, **attrs):
+    """Re-emits records captured elsewhere (e.g. in a worker process) on the current trace."""
+    for record in records:
+        _emit({**{k: v for k, v in record.items() if k != "trace"}, **attrs})
+
+
+def record_usage(model, prompt_tokens=0, completion_tokens=0, images=0, **attrs):
+    _emit({"event": "usage", "model": model, "prompt_tokens": prompt_tokens,
+           "completion_tokens": completion_tokens, "images": images,
+           "cost": round(cost(model, prompt_tokens, completion_tokens, images), 6), **attrs})